@@ -18,6 +18,9 @@ SILICONFLOW_SK = os.getenv("SILICONFLOW_SK", "")
 # SILICONFLOW_MODEL = os.getenv("SILICONFLOW_MODEL", "THUDM/glm-4-9b-chat")
 SILICONFLOW_MODEL = os.getenv("SILICONFLOW_MODEL", "THUDM/GLM-4-32B-0414")
 
+# Required in the X-Admin-Token header of /admin endpoints, which are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # Connect to Neo4j
 graph = Graph(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD),name="neo4j")
 matcher = NodeMatcher(graph)
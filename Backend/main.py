@@ -1,5 +1,6 @@
 from mcp import *
-from recommendation import recommend_by_tmdb_movies
+from recommendation import recommendation_executor, start_warmup, recommendation_status
+from recommendation import RecommendationNotReady, RecommendationBusy, RecommendationTimeout
 from neo4j import add_movie_to_neo4j
 from tmdb import fetch_movie_from_tmdb
 from tmdb import fetch_actor_from_tmdb
@@ -7,18 +8,20 @@ from tmdb import get_favorite_movies as get_favorite_movies_tmdb
 from neo4j import add_actor_to_neo4j
 from config import *
 from models import *
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from py2neo import Node, Relationship
 from typing import Optional, List
 import logging
 import requests
 import httpx
+import secrets
 from datetime import datetime
 from pathlib import Path
 import socketio
 import asyncio
+import json
 
 app = FastAPI()
 
@@ -30,6 +33,23 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.on_event("startup")
+async def warm_up_recommendations():
+    # Loads datasets, the SVD model and embeddings in a background thread, the API serves meanwhile
+    start_warmup()
+
+
+@app.exception_handler(RecommendationNotReady)
+@app.exception_handler(RecommendationBusy)
+async def recommendation_unavailable_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "10"})
+
+
+@app.exception_handler(RecommendationTimeout)
+async def recommendation_timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
 sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode='asgi')
 main_app = socketio.ASGIApp(sio, other_asgi_app=app)
 
@@ -396,6 +416,14 @@ async def get_movie_cast(title: str):
     }
 
 
+@app.get("/movies/{title}/similar")
+async def get_similar_movies(title: str, k: int = Query(20, ge=1, le=100)):
+    similar = await recommendation_executor.run("similar_movies", title, k)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Movie not found in the recommendation model")
+    return similar
+
+
 @app.get("/movie/poster/{title}")
 async def get_movie_poster(title: str):
     try:
@@ -437,11 +465,18 @@ async def health_check():
         "timestamp": datetime.utcnow().isoformat(),
         "services": {
             "neo4j": "up" if neo4j_status else "down",
-            "api": "up"
+            "api": "up",
+            "recommendation": recommendation_status()["state"]
         }
     }
 
 
+@app.get("/ready")
+async def readiness_check():
+    status = recommendation_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
 @app.post("/seed/actors")
 async def seed_actors():
     from seed_actors import seed_actors as seed_actors_func
@@ -505,18 +540,78 @@ async def get_favorite_movies(session_id: str, page: int = Query(1, ge=1)):
     return await get_favorite_movies_tmdb(session_id, page)
 
 
+BATCH_CHUNK_PROFILES = 256
+
+
 @app.get("/recommendations")
 async def get_recommend_movies(session_id: str):
     favorite_movies = await get_favorite_movies_tmdb(session_id, 1)
     # for each movie, get id
     tmdb_ids = [movie["id"] for movie in favorite_movies["results"]]
-    res = recommend_by_tmdb_movies(tmdb_ids)
+    res = await recommendation_executor.run("recommend_by_tmdb_movies", tmdb_ids)
     # print("Recommended movies:", res)
     return {
         "results": res,
     }
 
 
+def check_admin_token(token):
+    # Fail closed: without a configured token nobody may reload models
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled, set ADMIN_TOKEN to enable them")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/model")
+async def get_active_model(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    # answered by one worker; the others report the same version once they synced
+    return await recommendation_executor.run("model_status")
+
+
+@app.post("/admin/model/reload", status_code=202)
+async def reload_model(data: ModelReloadInput, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    # The new model loads and is smoke-tested in the background, GET /admin/model shows when it is active
+    try:
+        return await recommendation_executor.run("reload_model", data.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/recommendations/cache")
+async def get_recommendation_cache_stats():
+    stats = await recommendation_executor.run("recommendation_cache_stats")
+    stats["executor"] = recommendation_executor.stats()
+    return stats
+
+
+@app.post("/recommendations/batch")
+async def get_recommend_movies_batch(data: BatchRecommendInput):
+    if not 1 <= data.k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+    # Profiles go to the recommendation workers in chunks, the first one before the response starts
+    # so a busy or cold executor still answers with a 503
+    chunks = [(data.liked_movie_ids[i:i + BATCH_CHUNK_PROFILES], [], i)
+              for i in range(0, len(data.liked_movie_ids), BATCH_CHUNK_PROFILES)]
+    chunks += [([], data.user_ids[i:i + BATCH_CHUNK_PROFILES], i)
+               for i in range(0, len(data.user_ids), BATCH_CHUNK_PROFILES)]
+    first = await recommendation_executor.run("recommend_batch", chunks[0][0], chunks[0][1], k=data.k) \
+        if chunks else []
+
+    async def rows():
+        # one JSON object per profile, streamed as newline-delimited JSON
+        for n, (liked_movie_ids, user_ids, offset) in enumerate(chunks):
+            chunk_rows = first if n == 0 else \
+                await recommendation_executor.run("recommend_batch", liked_movie_ids, user_ids, k=data.k)
+            for row in chunk_rows:
+                row["index"] += offset
+                yield json.dumps(row) + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
 class RecommendInput(BaseModel):
     genre: str
     country: str
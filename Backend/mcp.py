@@ -4,7 +4,7 @@ from urllib.parse import quote
 
 import requests
 from config import *
-from recommendation import recommend_by_genres
+from recommendation import recommendation_executor, RecommendationNotReady, RecommendationBusy, RecommendationTimeout
 
 # 会话上下文管理
 user_sessions = {}
@@ -48,7 +48,12 @@ def search_actor_tmdb(name):
     }
 
 def recommend_by_genres_wrap(genres, keywords):
-    result = recommend_by_genres(genres, keywords)
+    try:
+        result = recommendation_executor.call("recommend_by_genres", genres, keywords)
+    except RecommendationNotReady:
+        return {"error": "The recommendation engine is still starting up, please try again in a minute."}
+    except (RecommendationBusy, RecommendationTimeout):
+        return {"error": "The recommendation engine is busy, please try again in a minute."}
     for movie in result:
         movie["url"] = f"https://movie.com/?q={quote(movie['title'])}&type=movie"
     return result
@@ -24,4 +24,12 @@ class ActorFilmography(BaseModel):
 class ActorCreate(BaseModel):
     name: str
     date_of_birth: Optional[str] = None
-    gender: Optional[str] = None
\ No newline at end of file
+    gender: Optional[str] = None
+
+class BatchRecommendInput(BaseModel):
+    liked_movie_ids: List[List[int]] = []
+    user_ids: List[int] = []
+    k: int = 20
+
+class ModelReloadInput(BaseModel):
+    path: Optional[str] = None
@@ -1,10 +1,39 @@
-# setup the environment
-from .prepare_env import setup_model_data_auto
+# The environment (model data, embeddings) and the artifacts are loaded in the background by
+# recommendation_loader; call start_warmup() at startup. Until it is ready the functions below
+# raise RecommendationNotReady instead of blocking.
+import os
+from .loader import recommendation_loader, RecommendationNotReady
+from .executor import RecommendationExecutor, RecommendationBusy, RecommendationTimeout
 
-setup_model_data_auto()
+# Servers call the utils functions by name through this executor, e.g.
+# await recommendation_executor.run("recommend_by_tmdb_movies", tmdb_ids)
+recommendation_executor = RecommendationExecutor(
+    workers=int(os.getenv("RECOMMENDATION_WORKERS", 1)),
+    max_pending=int(os.getenv("RECOMMENDATION_MAX_PENDING", 32)),
+    timeout=float(os.getenv("RECOMMENDATION_TIMEOUT", 30)),
+)
 
 
+def start_warmup():
+    recommendation_executor.start()
 
 
-# export necessary functions
-from .utils import recommend_by_tmdb_movies, recommend_by_genres
+def recommendation_status():
+    return recommendation_executor.status()
+
+
+# export necessary functions; like the servers, these run on the executor (blocking the caller)
+def recommend_by_tmdb_movies(tmdb_ids):
+    return recommendation_executor.call("recommend_by_tmdb_movies", tmdb_ids)
+
+
+def recommend_by_genres(genres, keywords):
+    return recommendation_executor.call("recommend_by_genres", genres, keywords)
+
+
+def recommend_batch(liked_movie_ids_lists=None, user_ids=None, k=20):
+    return recommendation_executor.call("recommend_batch", liked_movie_ids_lists, user_ids, k=k)
+
+
+def recommendation_cache_stats():
+    return recommendation_executor.call("recommendation_cache_stats")
@@ -0,0 +1,187 @@
+import argparse
+import os
+import time
+import numpy as np
+
+try:
+    from .fileio import atomic_path
+except ImportError:
+    from fileio import atomic_path
+
+
+ANN_INDEX_FILE = "ann_index.npz"
+ANN_MIN_ITEMS = 100_000  # below this exact scoring is fast enough
+KMEANS_SAMPLE_SIZE = 50_000
+ASSIGN_BLOCK_ROWS = 16384
+
+
+class IVFIndex:
+    """
+    Inverted-file index for maximum inner product search over the SVD item factors.
+    Items are clustered with k-means; a query scores the centroids, probes the n_probe
+    best lists and scores only the items in them exactly. Raising n_probe trades latency
+    for recall, n_probe == n_lists is exact.
+    """
+
+    def __init__(self, n_lists=256, n_probe=8, n_iter=15, seed=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_items = None
+        self.n_items = None
+        self.version = None  # of the model whose item factors were clustered
+
+    def build(self, item_factors, version=None):
+        rng = np.random.default_rng(self.seed)
+        n_items = len(item_factors)
+        self.n_items = n_items
+        self.version = version
+        self.n_lists = min(self.n_lists, n_items)
+
+        # Train the centroids on a sample, then assign every item
+        sample = item_factors[np.sort(rng.choice(n_items, size=min(KMEANS_SAMPLE_SIZE, n_items), replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignment = _nearest_centroid(sample, centroids)
+            counts = np.bincount(assignment, minlength=self.n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty lists with random sample points
+            centroids[~filled] = sample[rng.choice(len(sample), size=int((~filled).sum()), replace=False)]
+
+        assignment = np.empty(n_items, dtype=np.int32)
+        for start in range(0, n_items, ASSIGN_BLOCK_ROWS):
+            block = np.asarray(item_factors[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+            assignment[start:start + len(block)] = _nearest_centroid(block, centroids)
+
+        self.centroids = centroids
+        self.list_items = np.argsort(assignment, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=self.n_lists))))
+        return self
+
+    def candidates(self, item_factors, query, n_probe=None):
+        """
+        Exact scores for the items in the n_probe lists closest to the query.
+        Returns (item_indices, scores).
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        query = np.asarray(query, dtype=np.float32)
+        probe = np.argpartition(np.dot(self.centroids, query), -n_probe)[-n_probe:]
+        items = np.concatenate([self.list_items[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probe])
+        items.sort()  # sequential reads from the (memory-mapped) factors
+        return items, np.dot(np.asarray(item_factors[items], dtype=np.float32), query)
+
+    def search(self, item_factors, query, k, n_probe=None):
+        items, scores = self.candidates(item_factors, query, n_probe)
+        k = min(k, len(items))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return items[top], scores[top]
+
+    def save(self, path):
+        # through a file object: np.savez would append .npz to the temporary name
+        with atomic_path(os.path.join(path, ANN_INDEX_FILE)) as tmp_path, open(tmp_path, "wb") as f:
+            np.savez(f,
+                     centroids=self.centroids,
+                     list_offsets=self.list_offsets,
+                     list_items=self.list_items,
+                     n_probe=self.n_probe,
+                     n_items=self.n_items,
+                     version=str(self.version))
+
+    @classmethod
+    def load(cls, path, version=None, n_items=None):
+        """
+        Load the index in path. Returns None if there is none, or if it was built for another
+        model version or catalog size than the given ones.
+        """
+        index_path = os.path.join(path, ANN_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return None
+        with np.load(index_path) as data:
+            if "version" not in data:
+                print(f"⚠️ {index_path} does not record its model version; ignoring it, rebuild it with ann_index --save")
+                return None
+            # Folding in ratings ("<version>+<n>") only changes user factors, the index stays valid
+            built_for = (str(data["version"]), int(data["n_items"]))
+            if version is not None and built_for[0] != version.split("+")[0] \
+                    or n_items is not None and built_for[1] != n_items:
+                print(f"⚠️ {index_path} belongs to model {built_for[0]} with {built_for[1]} items, "
+                      f"not {version} with {n_items}; ignoring it")
+                return None
+            index = cls(n_lists=len(data["centroids"]), n_probe=int(data["n_probe"]))
+            index.centroids = data["centroids"]
+            index.list_offsets = data["list_offsets"]
+            index.list_items = data["list_items"]
+            index.version, index.n_items = built_for
+        return index
+
+
+def _nearest_centroid(points, centroids):
+    # argmin ||p - c||^2 == argmax (p.c - ||c||^2 / 2)
+    return np.argmax(np.dot(points, centroids.T) - 0.5 * (centroids ** 2).sum(axis=1), axis=1).astype(np.int32)
+
+
+def benchmark(item_factors, queries, index, k=10, n_probes=(1, 2, 4, 8, 16, 32)):
+    """
+    Recall@k and mean latency of the index against exact scoring for each n_probe.
+    """
+    exact_ms, exact_top = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = np.dot(item_factors, query)
+        top = np.argpartition(scores, -k)[-k:]
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        exact_top.append(set(top.tolist()))
+
+    report = {"exact": {"recall": 1.0, "latency_ms": float(np.mean(exact_ms))}}
+    for n_probe in n_probes:
+        if n_probe > index.n_lists:
+            break
+        hits, latency_ms = 0, []
+        for query, truth in zip(queries, exact_top):
+            start = time.perf_counter()
+            items, _ = index.search(item_factors, query, k, n_probe)
+            latency_ms.append((time.perf_counter() - start) * 1000)
+            hits += len(truth & set(items.tolist()))
+        report[f"n_probe={n_probe}"] = {
+            "recall": hits / (k * len(queries)),
+            "latency_ms": float(np.mean(latency_ms)),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    from .model_based_cf import SVDRecommender
+
+    parser = argparse.ArgumentParser(description="Build an IVF index over the SVD item factors and benchmark it.")
+    parser.add_argument("model_dir", nargs="?", default=os.path.join(os.path.dirname(__file__), "svd_model_500"))
+    parser.add_argument("--n-lists", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--save", action="store_true", help="store the index in the model directory")
+    args = parser.parse_args()
+
+    recommender = SVDRecommender()
+    recommender.load(args.model_dir)
+
+    start = time.perf_counter()
+    index = IVFIndex(n_lists=args.n_lists).build(recommender.item_factors, version=recommender.version.split("+")[0])
+    print(f"✅ Built IVF index with {index.n_lists} lists over {len(recommender.item_factors)} items "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    rng = np.random.default_rng(0)
+    queries = np.asarray(recommender.user_factors[rng.choice(len(recommender.user_factors), size=args.queries)],
+                         dtype=np.float32)
+    for name, result in benchmark(recommender.item_factors, queries, index, k=args.k).items():
+        print(f"{name:>12}: recall@{args.k} {result['recall']:.3f}, {result['latency_ms']:.2f} ms/query")
+
+    if args.save:
+        index.save(args.model_dir)
+        print(f"✅ Saved index to {os.path.join(args.model_dir, ANN_INDEX_FILE)}")
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from pathlib import Path
+import pandas as pd
+from .tag_index import file_fingerprint
+from .fileio import atomic_path, write_json_atomic
+
+try:
+    import pyarrow  # noqa: F401  (Feather support for pandas)
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+DATASET_CACHE_DIR = Path(__file__).parent / "dataset_cache"
+DATASET_CACHE_VERSION = 1
+
+# name -> (CSV path, projected columns with their dtypes); only the columns the recommender reads
+DATASETS = {
+    "tmdb": (Path(__file__).parent / "TMDB_movie_dataset_v11.csv",
+             {"id": "Int64", "title": object, "genres": object, "keywords": object}),
+    "movielens_movies": (Path(__file__).parent / "TheMoviesDataset/movies.csv",
+                         {"movieId": "int32", "title": object}),
+    "movies_metadata": (Path(__file__).parent / "TheMoviesDataset/movies_metadata.csv",
+                        {"id": object, "title": object, "release_date": "category"}),
+    "links": (Path(__file__).parent / "TheMoviesDataset/links.csv",
+              {"movieId": "int32", "tmdbId": "Int64", "imdbId": "Int64"}),
+}
+
+# name -> {"source", "rows", "seconds", "memory_mb"} of the last load
+DATASET_STATS = {}
+
+
+def read_projected_csv(csv_path, columns):
+    # Text columns are read as str so ids like "0114709" or junk rows are not guessed at
+    df = pd.read_csv(csv_path, usecols=list(columns), dtype={col: str for col in columns})
+    for col, dtype in columns.items():
+        if dtype == "Int64":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+        elif dtype is not object:
+            df[col] = df[col].astype(dtype)
+    return df[list(columns)]
+
+
+def _cache_files(name, cache_dir):
+    csv_path, columns = DATASETS[name]
+    meta = {"version": DATASET_CACHE_VERSION, "fingerprint": file_fingerprint(csv_path),
+            "columns": {col: str(dtype) for col, dtype in columns.items()}}
+    return Path(cache_dir) / f"{name}.feather", Path(cache_dir) / f"{name}.json", meta
+
+
+def _cache_is_current(cache_path, meta_path, meta):
+    if not (HAS_PYARROW and cache_path.exists() and meta_path.exists()):
+        return False
+    with open(meta_path) as f:
+        return json.load(f) == meta
+
+
+def _write_cache(df, cache_path, meta_path, meta):
+    # Other workers may be reading the cache: replace both files whole, the sidecar last
+    os.makedirs(cache_path.parent, exist_ok=True)
+    with atomic_path(cache_path) as tmp_path:
+        df.to_feather(tmp_path)
+    write_json_atomic(meta_path, meta)
+
+
+def ensure_dataset_cache(name, cache_dir=DATASET_CACHE_DIR):
+    """
+    Convert the CSV into its Feather cache if the cache is missing or stale, without loading it.
+    """
+    cache_path, meta_path, meta = _cache_files(name, cache_dir)
+    if HAS_PYARROW and not _cache_is_current(cache_path, meta_path, meta):
+        _write_cache(read_projected_csv(*DATASETS[name]), cache_path, meta_path, meta)
+
+
+def load_dataset(name, cache_dir=DATASET_CACHE_DIR):
+    """
+    Load a dataset from its Feather cache, converting the CSV first if the cache is missing
+    or was built from a different file. Without pyarrow the projected CSV is read every time.
+    """
+    cache_path, meta_path, meta = _cache_files(name, cache_dir)
+    start = time.perf_counter()
+    source = "csv"
+    if _cache_is_current(cache_path, meta_path, meta):
+        df = pd.read_feather(cache_path)
+        source = "cache"
+    else:
+        df = read_projected_csv(*DATASETS[name])
+        if HAS_PYARROW:
+            _write_cache(df, cache_path, meta_path, meta)
+
+    stats = {
+        "source": source,
+        "rows": len(df),
+        "seconds": round(time.perf_counter() - start, 3),
+        "memory_mb": round(df.memory_usage(deep=True).sum() / 2 ** 20, 1),
+    }
+    DATASET_STATS[name] = stats
+    print(f"📦 {name}: {stats['rows']} rows from {source} in {stats['seconds']}s, {stats['memory_mb']} MB")
+    return df
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+try:
+    from .model_based_cf import SVDRecommender, lookup_sorted, top_k_indices_rows
+except ImportError:  # run as a script from this directory, like test_evaluate.py
+    from model_based_cf import SVDRecommender, lookup_sorted, top_k_indices_rows
+
+
+RMSE_BLOCK_ROWS = 32_768  # gathers two RMSE_BLOCK_ROWS x n_components float32 blocks, ~130 MB at 500
+RANKING_TASK_USERS = 2048
+SCORE_BLOCK_USERS = 256
+
+# Set in every pool worker by _init_worker
+_worker_recommender = None
+
+
+def encode_test_set(test_df, recommender):
+    """
+    Encoded (users, items, ratings) arrays for the test ratings the model knows, sorted by user.
+    """
+    users, known_user = lookup_sorted(recommender.user_enc.classes_, test_df['userId'].to_numpy())
+    items, known_item = lookup_sorted(recommender.movie_enc.classes_, test_df['movieId'].to_numpy())
+    known = known_user & known_item
+    users, items = users[known], items[known]
+    ratings = test_df['rating'].to_numpy(dtype=np.float32)[known]
+    order = np.argsort(users, kind='stable')
+    return users[order], items[order], ratings[order]
+
+
+def compute_rmse(recommender, users, items, ratings):
+    """
+    RMSE of the clipped dot-product predictions, gathered in blocks of rows.
+    """
+    squared_error = 0.0
+    for start in range(0, len(users), RMSE_BLOCK_ROWS):
+        u = users[start:start + RMSE_BLOCK_ROWS]
+        m = items[start:start + RMSE_BLOCK_ROWS]
+        preds = np.einsum('ij,ij->i',
+                          np.asarray(recommender.user_factors[u], dtype=np.float32),
+                          np.asarray(recommender.item_factors[m], dtype=np.float32))
+        squared_error += float(((np.clip(preds, 1.0, 5.0) - ratings[start:start + RMSE_BLOCK_ROWS]) ** 2).sum())
+    return float(np.sqrt(squared_error / max(len(users), 1)))
+
+
+def holdout_split(users, items, ratings, threshold=4.0, frac=0.5, seed=42):
+    """
+    For every user with at least two ratings >= threshold, hide round(frac * n) of them at random.
+    Returns the evaluated users and, aligned to them, CSR-style offsets into the hidden items.
+    """
+    high = ratings >= threshold
+    users, items = users[high], items[high]
+
+    # Shuffle inside each user block, then hide the first round(frac * n) rows of the block
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(users)), users))
+    users, items = users[order], items[order]
+    eval_users, starts, counts = np.unique(users, return_index=True, return_counts=True)
+    keep = counts >= 2
+    n_hidden = np.where(keep, np.rint(frac * counts), 0).astype(np.int64)
+    rank = np.arange(len(users)) - np.repeat(starts, counts)
+    hidden_items = items[rank < np.repeat(n_hidden, counts)]
+    return eval_users[keep], np.concatenate(([0], np.cumsum(n_hidden[keep]))), hidden_items
+
+
+def ranking_metrics(recommender, eval_users, hidden_offsets, hidden_items, k=10, min_ratings=100):
+    """
+    Precision/Recall/F1@k per user. Candidates are scored SCORE_BLOCK_USERS users at a time
+    and, like evaluate_with_holdout, seen movies are not filtered.
+    """
+    n_items = len(recommender.movie_ids)
+    eligible = recommender.rating_counts >= min_ratings
+    precision = np.empty(len(eval_users))
+    recall = np.empty(len(eval_users))
+
+    for start in range(0, len(eval_users), SCORE_BLOCK_USERS):
+        block = eval_users[start:start + SCORE_BLOCK_USERS]
+        scores = recommender._score_items(np.asarray(recommender.user_factors[block], dtype=np.float32))
+        scores = np.where(eligible, np.clip(scores, 1.0, 5.0), -np.inf)
+        top_idx = top_k_indices_rows(scores, k)
+
+        rows = np.arange(len(block))
+        offsets = hidden_offsets[start:start + len(block) + 1]
+        n_hidden = np.diff(offsets)
+        hidden_keys = np.repeat(rows, n_hidden) * n_items + hidden_items[offsets[0]:offsets[-1]]
+        hits = np.isin(rows[:, None] * n_items + top_idx, hidden_keys).sum(axis=1)
+
+        precision[start:start + len(block)] = hits / k
+        recall[start:start + len(block)] = hits / n_hidden
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(precision), where=(precision + recall) > 0)
+    return precision, recall, f1
+
+
+def _init_worker(model_dir):
+    global _worker_recommender
+    # Factors are memory-mapped, so workers share one copy of them
+    _worker_recommender = SVDRecommender()
+    _worker_recommender.load(model_dir)
+
+
+def _ranking_task(args):
+    eval_users, hidden_offsets, hidden_items, k, min_ratings = args
+    return ranking_metrics(_worker_recommender, eval_users, hidden_offsets, hidden_items, k, min_ratings)
+
+
+def evaluate(model_dir, test_df, k=10, threshold=4.0, min_ratings=100, workers=None, sample_users=None):
+    """
+    Full-scale offline evaluation of a saved model: RMSE over all known test ratings and
+    Precision/Recall/F1@k over every test user with at least two high ratings.
+    Returns a JSON-serialisable report with metrics, timings and throughput.
+    """
+    timings = {}
+    start = time.perf_counter()
+    recommender = SVDRecommender()
+    recommender.load(model_dir)
+    timings["load_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    users, items, ratings = encode_test_set(test_df, recommender)
+    eval_users, hidden_offsets, hidden_items = holdout_split(users, items, ratings, threshold)
+    if sample_users is not None and sample_users < len(eval_users):
+        pick = np.sort(np.random.default_rng(42).choice(len(eval_users), size=sample_users, replace=False))
+        hidden_items = np.concatenate([hidden_items[hidden_offsets[i]:hidden_offsets[i + 1]] for i in pick])
+        hidden_offsets = np.concatenate(([0], np.cumsum(np.diff(hidden_offsets)[pick])))
+        eval_users = eval_users[pick]
+    timings["prepare_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rmse = compute_rmse(recommender, users, items, ratings)
+    timings["rmse_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(0, len(eval_users), RANKING_TASK_USERS):
+        offsets = hidden_offsets[i:i + RANKING_TASK_USERS + 1]
+        tasks.append((eval_users[i:i + RANKING_TASK_USERS], offsets - offsets[0],
+                      hidden_items[offsets[0]:offsets[-1]], k, min_ratings))
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_dir,)) as pool:
+            results = list(pool.map(_ranking_task, tasks))
+    else:
+        results = [ranking_metrics(recommender, *task) for task in tasks]
+    precision, recall, f1 = (np.concatenate([r[i] for r in results]) if results else np.empty(0) for i in range(3))
+    timings["ranking_s"] = time.perf_counter() - start
+
+    return {
+        "model_dir": str(model_dir),
+        "k": k,
+        "threshold": threshold,
+        "min_ratings": min_ratings,
+        "workers": workers,
+        "test_ratings": int(len(users)),
+        "users_evaluated": int(len(eval_users)),
+        "rmse": rmse,
+        f"precision@{k}": float(precision.mean()) if len(precision) else None,
+        f"recall@{k}": float(recall.mean()) if len(recall) else None,
+        f"f1@{k}": float(f1.mean()) if len(f1) else None,
+        "timings": timings,
+        "throughput": {
+            "rmse_ratings_per_s": len(users) / timings["rmse_s"] if timings["rmse_s"] > 0 else None,
+            "ranking_users_per_s": len(eval_users) / timings["ranking_s"] if timings["ranking_s"] > 0 else None,
+        },
+    }
+
+
+if __name__ == "__main__":
+    from sklearn.model_selection import train_test_split
+
+    parser = argparse.ArgumentParser(description="Evaluate a saved SVD model on a holdout split of the ratings.")
+    parser.add_argument("--model", default="svd_model_500/")
+    parser.add_argument("--ratings", default="TheMoviesDataset/ratings.csv")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sample-users", type=int, default=None)
+    parser.add_argument("--report", default="evaluation_report.json")
+    args = parser.parse_args()
+
+    ratings_df = pd.read_csv(args.ratings, usecols=["userId", "movieId", "rating"],
+                             dtype={"userId": np.int32, "movieId": np.int32, "rating": np.float32})
+    _, test_df = train_test_split(ratings_df, test_size=0.2, random_state=42)
+    del ratings_df
+
+    report = evaluate(args.model, test_df, k=args.k, workers=args.workers, sample_users=args.sample_users)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n✅ Test RMSE:      {report['rmse']:.4f}")
+    print(f"✅ Precision@{args.k}:  {report[f'precision@{args.k}']:.4f}")
+    print(f"✅ Recall@{args.k}:     {report[f'recall@{args.k}']:.4f}")
+    print(f"✅ F1@{args.k}:         {report[f'f1@{args.k}']:.4f}")
+    print(f"Report written to {args.report}")
@@ -0,0 +1,254 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from queue import Empty
+from .loader import recommendation_loader, RecommendationNotReady
+
+
+LATENCY_WINDOW = 1024
+# Pools rebuilt after a worker died before any new worker got ready; then the executor stays failed
+MAX_POOL_RESTARTS = 3
+
+
+class RecommendationBusy(Exception):
+    """
+    Raised when max_pending recommendation calls are already queued or running.
+    """
+
+
+class RecommendationTimeout(Exception):
+    """
+    Raised when a recommendation call did not finish within the executor timeout.
+    """
+
+
+def _init_worker(status_queue):
+    # Every pool process loads the artifacts once, before it takes any call, and reports how
+    # that went. The parent already prepared the files, workers only read them.
+    recommendation_loader.start(prepare=False)
+    recommendation_loader.wait()
+    status_queue.put(_worker_status())
+
+
+def _worker_status():
+    status = recommendation_loader.status()
+    status["pid"] = os.getpid()
+    return status
+
+
+def _call(name, args, kwargs):
+    result = getattr(recommendation_loader.require(), name)(*args, **kwargs)
+    return list(result) if inspect.isgenerator(result) else result
+
+
+class RecommendationExecutor:
+    """
+    Runs the CPU-bound recommendation functions of utils off the event loop.
+    With workers > 0 they run in a process pool whose processes each load the artifacts once;
+    with workers == 0 they run on threads of this process, which loads the artifacts itself.
+    At most max_pending calls are queued or running, and callers give up after timeout seconds.
+    """
+
+    def __init__(self, workers=1, max_pending=32, timeout=30.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = None
+        self._status_queue = None
+        self._started = False
+        self._lock = threading.Lock()
+        self.worker_status = {}  # pid -> loader status, process mode only
+        self.pool_error = None  # why the last process pool broke, or why preparing failed
+        self.pool_restarts = 0
+        self._failed_restarts = 0  # restarts since a worker was last ready
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            if self.workers > 0:
+                # Files are prepared once here, in the background, before any worker reads them
+                threading.Thread(target=self._prepare_and_start_pool, name="recommendation-prepare",
+                                 daemon=True).start()
+            else:
+                recommendation_loader.start()
+                self._pool = ThreadPoolExecutor(max_workers=max(1, os.cpu_count() or 1),
+                                                thread_name_prefix="recommendation")
+
+    def _prepare_and_start_pool(self):
+        try:
+            recommendation_loader.prepare()
+        except Exception as e:
+            self.pool_error = f"{type(e).__name__}: {e}"
+            print(f"❌ Failed to prepare the recommendation data: {self.pool_error}")
+            return
+        with self._lock:
+            self._start_pool()
+
+    def _start_pool(self):
+        # spawn: the pool must not inherit the server's threads or event loop
+        context = multiprocessing.get_context("spawn")
+        self._status_queue = context.Queue()
+        self.worker_status = {}
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                         initializer=_init_worker, initargs=(self._status_queue,))
+        # ProcessPoolExecutor starts processes on demand, make all of them load now
+        for _ in range(self.workers):
+            self._pool.submit(os.getpid)
+
+    def _check_pool(self):
+        """
+        Collect the status reports of new workers, and replace the pool if a worker died
+        (OOM, segfault): a broken ProcessPoolExecutor fails every later call.
+        """
+        if self.workers == 0 or self._pool is None:
+            return
+        while True:
+            try:
+                status = self._status_queue.get_nowait()
+            except (Empty, OSError, ValueError):
+                break
+            self.worker_status[status["pid"]] = status
+            if status["ready"]:
+                self._failed_restarts = 0
+        # _broken is set by the pool's management thread once a worker exits unexpectedly
+        if not getattr(self._pool, "_broken", False):
+            return
+        with self._lock:
+            if self._pool is None or not getattr(self._pool, "_broken", False):
+                return  # another thread already handled it
+            self.pool_error = f"BrokenProcessPool: {self._pool._broken}"
+            print(f"❌ Recommendation worker died: {self.pool_error}")
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self.worker_status = {}
+            if self._failed_restarts >= MAX_POOL_RESTARTS:
+                return
+            self._failed_restarts += 1
+            self.pool_restarts += 1
+            self._start_pool()
+
+    @property
+    def ready(self):
+        if self.workers > 0:
+            self._check_pool()
+            return self._pool is not None and any(status["ready"] for status in self.worker_status.values())
+        return recommendation_loader.module is not None
+
+    def submit(self, name, *args, **kwargs):
+        """
+        Submit utils.<name>(*args, **kwargs); returns a concurrent.futures.Future.
+        """
+        if not self.ready:
+            if self.workers > 0:
+                error = self.status()["error"]
+                raise RecommendationNotReady(f"Recommendation workers failed: {error}" if error
+                                             else "Recommendation workers are loading")
+            recommendation_loader.require()
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise RecommendationBusy(f"{self.pending} recommendation calls already pending")
+            self.pending += 1
+            pool = self._pool
+        start = time.perf_counter()
+        try:
+            if pool is None:
+                raise BrokenProcessPool("the pool was shut down")
+            future = pool.submit(_call, name, args, kwargs)
+        except BrokenProcessPool as e:
+            with self._lock:
+                self.pending -= 1
+                self.failed += 1
+            self._check_pool()
+            raise RecommendationNotReady(f"Recommendation workers are restarting: {e}")
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(lambda f: self._finish(f, start))
+        return future
+
+    def _finish(self, future, start):
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    async def run(self, name, *args, **kwargs):
+        future = self.submit(name, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise RecommendationTimeout(f"{name} did not finish within {self.timeout}s")
+        except BrokenProcessPool as e:
+            raise RecommendationNotReady(f"A recommendation worker died during {name}: {e}")
+
+    def call(self, name, *args, **kwargs):
+        """
+        Blocking variant of run() for synchronous callers such as the chat tools.
+        """
+        future = self.submit(name, *args, **kwargs)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            raise RecommendationTimeout(f"{name} did not finish within {self.timeout}s")
+        except BrokenProcessPool as e:
+            raise RecommendationNotReady(f"A recommendation worker died during {name}: {e}")
+
+    def status(self):
+        if self.workers == 0:
+            status = recommendation_loader.status()
+            status["mode"] = "thread"
+            return status
+        ready = self.ready
+        workers = list(self.worker_status.values())
+        failed = [status["error"] for status in workers if status["error"]]
+        if self._pool is None and self.pool_error:
+            failed.append(self.pool_error)  # preparing failed, or the pool broke too often
+        return {
+            "ready": ready,
+            "state": "ready" if ready else ("failed" if failed else "loading"),
+            "error": failed[0] if failed else None,
+            "mode": "process",
+            "prepare": recommendation_loader.artifacts.get("model_data"),
+            "workers": workers,
+            "pool_restarts": self.pool_restarts,
+            "last_pool_error": self.pool_error,
+        }
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "timeout": self.timeout,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("max", 1.0)):
+            stats[f"latency_{name}_s"] = round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 4) \
+                if latencies else None
+        return stats
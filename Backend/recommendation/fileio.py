@@ -0,0 +1,31 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path next to path and move it over path once the block succeeds.
+    Processes reading path meanwhile see the old file or the complete new one, never a partial one.
+    """
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_array_atomic(path, array):
+    # through a file object: np.save would append .npy to the temporary name
+    with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        np.save(f, array)
+
+
+def write_json_atomic(path, data, indent=None):
+    with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(data, f, indent=indent)
@@ -1,16 +1,41 @@
+import hashlib
+import json
+import os
+import threading
+import time
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import torch
 from sentence_transformers import SentenceTransformer, util
+from .cache import TTLCache
+from .fileio import atomic_path, save_array_atomic, write_json_atomic
 
 
 # 加载 BERT 语义向量模型
-model = SentenceTransformer('all-MiniLM-L6-v2')  # 推荐用于小规模项目，快速又精确
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'  # 推荐用于小规模项目，快速又精确
+_model = None
+_model_lock = threading.Lock()
 
 GENRES_PT_FILE = Path(__file__).parent / "filter_options" / "genres.pt"
 KEYWORDS_PT_FILE = Path(__file__).parent / "filter_options" / "keywords.pt"
 GENRES_CSV_FILE = Path(__file__).parent / "filter_options" / "genres.csv"
 KEYWORDS_CSV_FILE = Path(__file__).parent / "filter_options" / "keywords.csv"
+QUERY_CACHE_FILE = Path(__file__).parent / "filter_options" / "query_cache.npz"
+GENRES_COMPACT_PREFIX = Path(__file__).parent / "filter_options" / "genres"
+KEYWORDS_COMPACT_PREFIX = Path(__file__).parent / "filter_options" / "keywords"
+COMPACT_DTYPES = {"float16", "int8"}
+SIMILARITY_BLOCK_ROWS = 16384
+
+def get_model():
+    """
+    The shared SentenceTransformer, loaded on first use.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
 
 def read_single_column_csv(filepath):
     df = pd.read_csv(filepath)
@@ -18,17 +43,235 @@ def read_single_column_csv(filepath):
     entries = df[col_name].dropna().astype(str).tolist()
     return entries
 
-def encode_and_save_embeddings_from_csv(csv_path, output_path):
-    entries = read_single_column_csv(csv_path)
-    embeddings = model.encode(entries, convert_to_tensor=True)
-    torch.save({"entries": entries, "embeddings": embeddings}, output_path)
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def pt_meta_path(pt_path):
+    return f"{pt_path}.meta.json"
+
+def read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def encode_and_save_embeddings_from_csv(csv_path, output_path, compact_prefix=None, compact_dtype="float16",
+                                        force=False):
+    """
+    Encode the entries of a single-column CSV into output_path (and the compact files).
+    The .pt records the CSV's sha256 and the model name: when both match nothing is encoded,
+    and otherwise only entries without a stored embedding from the same model are encoded.
+    Both are also kept in small sidecars (<output_path>.meta.json, <prefix>.meta.json), so an
+    up-to-date setup is detected without deserializing the .pt.
+    Returns the number of encoded entries.
+    """
+    start = time.perf_counter()
+    source_hash = file_sha256(csv_path)
+    meta = {"model_name": EMBEDDING_MODEL_NAME, "source_hash": source_hash}
+    compact_meta = dict(meta, dtype=compact_dtype)
+    if not force and os.path.exists(output_path) and read_json(pt_meta_path(output_path)) == meta and (
+            compact_prefix is None or
+            (has_compact_embeddings(compact_prefix) and read_compact_meta(compact_prefix) == compact_meta)):
+        print(f"✅ {Path(csv_path).stem} embeddings are up to date")
+        return 0
+
+    old = torch.load(output_path) if os.path.exists(output_path) and not force else {}
+    # Files written before the metadata was recorded were always encoded with this model
+    same_model = old.get("model_name", 'all-MiniLM-L6-v2') == EMBEDDING_MODEL_NAME
+
+    if same_model and old.get("source_hash") == source_hash:
+        entries, embeddings, n_encoded = old["entries"], old["embeddings"], 0
+    else:
+        entries = read_single_column_csv(csv_path)
+        known = {entry: i for i, entry in enumerate(old.get("entries", []))} if same_model else {}
+        missing = [entry for entry in dict.fromkeys(entries) if entry not in known]
+        n_encoded = len(missing)
+        print(f"{Path(csv_path).name}: {len(entries)} entries, encoding {n_encoded}, "
+              f"reusing {len(entries) - n_encoded}...")
+        if not known:
+            embeddings = get_model().encode(entries, convert_to_tensor=True, show_progress_bar=len(entries) > 1000)
+        else:
+            new_embeddings = get_model().encode(missing, convert_to_tensor=True, show_progress_bar=len(missing) > 1000) \
+                if missing else old["embeddings"][:0]
+            rows = {entry: i for i, entry in enumerate(missing)}
+            stored = old["embeddings"].to(new_embeddings.device)
+            embeddings = torch.stack([new_embeddings[rows[entry]] if entry in rows else stored[known[entry]]
+                                      for entry in entries]) if entries else stored[:0]
+        with atomic_path(output_path) as tmp_path:
+            torch.save({"entries": entries, "embeddings": embeddings,
+                        "model_name": EMBEDDING_MODEL_NAME, "source_hash": source_hash}, tmp_path)
+    write_json_atomic(pt_meta_path(output_path), meta)
+
+    if compact_prefix is not None:
+        if n_encoded or not has_compact_embeddings(compact_prefix) or read_compact_meta(compact_prefix) != compact_meta:
+            save_compact_embeddings(entries, embeddings, compact_prefix, compact_dtype)
+            write_json_atomic(compact_paths(compact_prefix)["meta"], compact_meta)
+
+    if n_encoded:
+        print(f"✅ Encoded {n_encoded} {Path(csv_path).stem} entries in {time.perf_counter() - start:.1f}s")
+    else:
+        print(f"✅ {Path(csv_path).stem} embeddings are up to date")
+    return n_encoded
 
 def load_embeddings(file_path):
     data = torch.load(file_path)
     return data["entries"], data["embeddings"]
 
+class StringTable:
+    """
+    Read-only list of strings stored as one UTF-8 buffer plus int64 offsets, both memory-mappable.
+    """
+
+    def __init__(self, offsets, buffer):
+        self.offsets = offsets
+        self.buffer = buffer
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class CompactEmbeddings:
+    """
+    Row-normalized embedding matrix stored as float16, or as int8 with a float32 scale per row,
+    and searched with NumPy in blocks so no float32 copy of the whole matrix is ever made.
+    """
+
+    def __init__(self, vectors, scales=None):
+        self.vectors = vectors
+        self.scales = scales
+
+    @classmethod
+    def quantize(cls, embeddings, dtype="float16"):
+        if dtype not in COMPACT_DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(COMPACT_DTYPES)}, got {dtype!r}")
+        embeddings = embeddings.cpu().numpy() if torch.is_tensor(embeddings) else np.asarray(embeddings)
+        embeddings = embeddings.astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms > 0, norms, 1.0)
+        if dtype == "float16":
+            return cls(embeddings.astype(np.float16))
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        return cls(np.rint(embeddings / scales[:, None]).astype(np.int8), scales)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __array__(self, dtype=None, copy=None):
+        vectors = self.vectors.astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[:, None]
+        return vectors if dtype is None else vectors.astype(dtype)
+
+    def top_k(self, query_vectors, k):
+        """
+        (scores, indices) of the k most cosine-similar rows for every query, best first.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+        k = min(k, len(self.vectors))
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), SIMILARITY_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SIMILARITY_BLOCK_ROWS], dtype=np.float32)
+            scores = queries @ block.T
+            if self.scales is not None:
+                scores *= self.scales[start:start + SIMILARITY_BLOCK_ROWS]
+            # Keep the running top-k: merge this block's candidates with the best so far
+            block_k = min(k, scores.shape[1])
+            part = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+            best_indices = np.concatenate([best_indices, part + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_indices = np.take_along_axis(best_indices, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_indices, order, axis=1)
+
+
+def compact_paths(prefix):
+    prefix = str(prefix)
+    paths = {name: f"{prefix}.{name}.npy" for name in ("vectors", "scales", "offsets", "strings")}
+    paths["meta"] = f"{prefix}.meta.json"
+    return paths
+
+
+def save_compact_embeddings(entries, embeddings, prefix, dtype="float16"):
+    """
+    Write entries and embeddings as <prefix>.{vectors,scales,offsets,strings}.npy.
+    """
+    compact = CompactEmbeddings.quantize(embeddings, dtype)
+    strings = StringTable.from_strings(entries)
+    paths = compact_paths(prefix)
+    save_array_atomic(paths["vectors"], compact.vectors)
+    if compact.scales is not None:
+        save_array_atomic(paths["scales"], compact.scales)
+    elif os.path.exists(paths["scales"]):
+        os.remove(paths["scales"])
+    save_array_atomic(paths["offsets"], strings.offsets)
+    save_array_atomic(paths["strings"], strings.buffer)
+
+def read_compact_meta(prefix):
+    return read_json(compact_paths(prefix)["meta"])
+
+def has_compact_embeddings(prefix):
+    paths = compact_paths(prefix)
+    return all(os.path.exists(paths[name]) for name in ("vectors", "offsets", "strings"))
+
+def load_compact_embeddings(prefix):
+    """
+    Memory-mapped counterpart of load_embeddings: returns (StringTable, CompactEmbeddings).
+    """
+    paths = compact_paths(prefix)
+    scales = np.load(paths["scales"], mmap_mode="r") if os.path.exists(paths["scales"]) else None
+    entries = StringTable(np.load(paths["offsets"], mmap_mode="r"), np.load(paths["strings"], mmap_mode="r"))
+    embeddings = CompactEmbeddings(np.load(paths["vectors"], mmap_mode="r"), scales)
+    if len(entries) != len(embeddings):
+        raise ValueError(f"{prefix}: {len(entries)} entries but {len(embeddings)} embedding rows")
+    return entries, embeddings
+
+def compact_arrays(entries, embeddings, dtype="float16"):
+    """
+    The arrays of the compact format as a dict, quantizing torch embeddings if needed.
+    """
+    if not isinstance(embeddings, CompactEmbeddings):
+        embeddings = CompactEmbeddings.quantize(embeddings, dtype)
+    if not isinstance(entries, StringTable):
+        entries = StringTable.from_strings(entries)
+    arrays = {"vectors": embeddings.vectors, "offsets": entries.offsets, "strings": entries.buffer}
+    if embeddings.scales is not None:
+        arrays["scales"] = embeddings.scales
+    return arrays
+
+def compact_from_arrays(arrays):
+    return (StringTable(arrays["offsets"], arrays["strings"]),
+            CompactEmbeddings(arrays["vectors"], arrays.get("scales")))
+
 def find_top_k_similar_from_cache(query, entries, embeddings, k=5):
-    query_emb = model.encode(query, convert_to_tensor=True)
+    query_emb = get_model().encode(query, convert_to_tensor=True)
     cosine_scores = util.pytorch_cos_sim(query_emb, embeddings)[0]
     top_k = min(k, len(entries))
     top_results = torch.topk(cosine_scores, k=top_k)
@@ -36,3 +279,122 @@ def find_top_k_similar_from_cache(query, entries, embeddings, k=5):
 
 def get_names_with_score_gt(lst, score):
     return [item[0] for item in lst if item[1] >= score]
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+
+class QueryCache:
+    """
+    Bounded, thread-safe LRU caches in front of the sentence transformer: normalized query ->
+    embedding vector, and (query, option list, k, min_score) -> resolved names.
+    Cached names belong to the embeddings object they were resolved against, so clear()
+    after reloading the option lists. Only the embedding vectors are persisted.
+    """
+
+    def __init__(self, max_size=4096):
+        self.embeddings = TTLCache(max_size=max_size, ttl=None)
+        self.matches = TTLCache(max_size=max_size, ttl=None)
+
+    def warm(self, entries, embeddings):
+        """
+        Seed the cache with already-encoded option names, e.g. the genres from genres.pt.
+        """
+        vectors = embeddings.cpu().numpy() if torch.is_tensor(embeddings) else np.asarray(embeddings, dtype=np.float32)
+        for entry, vector in zip(entries, vectors):
+            self.embeddings.put(normalize_query(entry), vector)
+
+    @staticmethod
+    def _npz_path(path):
+        # np.savez appends .npz to paths without it; load must look for the same file
+        path = str(path)
+        return path if path.endswith(".npz") else path + ".npz"
+
+    def save(self, path=QUERY_CACHE_FILE):
+        items = self.embeddings.items()
+        if not items:
+            return
+        # Every worker saves at exit; each writes its own temporary file and the last rename wins
+        with atomic_path(self._npz_path(path)) as tmp_path, open(tmp_path, "wb") as f:
+            np.savez(f,
+                     queries=np.array([query for query, _ in items], dtype=str),
+                     embeddings=np.stack([vector for _, vector in items]).astype(np.float32))
+
+    def load(self, path=QUERY_CACHE_FILE):
+        path = self._npz_path(path)
+        if not os.path.exists(path):
+            return 0
+        try:
+            with np.load(path) as data:
+                queries, embeddings = data["queries"], data["embeddings"]
+        except Exception as e:
+            # Only a cache: start cold rather than fail loading the recommender
+            print(f"⚠️ Ignoring unreadable query cache {path}: {type(e).__name__}: {e}")
+            return 0
+        for query, vector in zip(queries, embeddings):
+            self.embeddings.put(str(query), vector)
+        return len(queries)
+
+    def clear(self):
+        self.embeddings.clear()
+        self.matches.clear()
+
+    def stats(self):
+        return {"embeddings": self.embeddings.stats(), "matches": self.matches.stats()}
+
+
+def resolve_terms(term_groups, k=3, min_score=0.5, cache=None):
+    """
+    Fuzzy-resolve several groups of query terms at once.
+    term_groups is a list of (queries, entries, embeddings), embeddings being a torch tensor or
+    CompactEmbeddings; all queries are encoded in one
+    batched model.encode call and each group is scored with a single similarity matrix.
+    Returns, per group, the distinct entries scoring >= min_score in any query's top-k.
+    With a QueryCache, known queries skip the encoder and known (query, group) pairs skip scoring.
+    """
+    groups = []
+    for queries, entries, embeddings in term_groups:
+        queries = list(dict.fromkeys(normalize_query(query) for query in queries))
+        cached = {}
+        if cache is not None:
+            for query in queries:
+                names = cache.matches.get((query, id(embeddings), k, min_score))
+                if names is not None:
+                    cached[query] = names
+        groups.append((queries, cached, entries, embeddings))
+
+    # Encode every distinct query that still needs scoring and has no cached vector, in one batch
+    vectors = {}
+    for queries, cached, _, _ in groups:
+        for query in queries:
+            if query not in cached and query not in vectors:
+                vectors[query] = cache.embeddings.get(query) if cache is not None else None
+    missing = [query for query, vector in vectors.items() if vector is None]
+    if missing:
+        encoded = get_model().encode(missing, convert_to_tensor=True).cpu().numpy()
+        for query, vector in zip(missing, encoded):
+            vectors[query] = vector
+            if cache is not None:
+                cache.embeddings.put(query, vector)
+
+    resolved = []
+    for queries, cached, entries, embeddings in groups:
+        names = {}
+        for query_names in cached.values():
+            names.update(dict.fromkeys(query_names))
+        to_score = [query for query in queries if query not in cached]
+        if to_score and len(entries):
+            query_embs = np.stack([vectors[query] for query in to_score])
+            if isinstance(embeddings, CompactEmbeddings):
+                top_scores, top_indices = embeddings.top_k(query_embs, k)
+            else:
+                cosine_scores = util.pytorch_cos_sim(torch.from_numpy(query_embs).to(embeddings.device), embeddings)
+                top_scores, top_indices = torch.topk(cosine_scores, k=min(k, len(entries)), dim=1)
+            for query, row_scores, row_indices in zip(to_score, top_scores.tolist(), top_indices.tolist()):
+                query_names = tuple(entries[idx] for score, idx in zip(row_scores, row_indices)
+                                    if score >= min_score)
+                names.update(dict.fromkeys(query_names))
+                if cache is not None:
+                    cache.matches.put((query, id(embeddings), k, min_score), query_names)
+        resolved.append(list(names))
+    return resolved
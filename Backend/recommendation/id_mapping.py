@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+
+ID_COLUMNS = ("movieId", "tmdbId", "imdbId")
+MISSING_ID = -1
+
+
+class IdMapping:
+    """
+    MovieLens movieId <-> TMDB id <-> IMDb id translation, built once from links.csv.
+    Every id column is kept as a sorted int64 key array plus the row order, so lookups
+    are searchsorted calls instead of DataFrame scans.
+    """
+
+    def __init__(self, links_df):
+        self.columns = {}
+        for col in ID_COLUMNS:
+            values = pd.to_numeric(links_df[col], errors="coerce")
+            self.columns[col] = values.fillna(MISSING_ID).to_numpy().astype(np.int64)
+
+        # Stable sort keeps file order among duplicate keys, so the first row wins
+        self._sorted = {}
+        for col, values in self.columns.items():
+            rows = np.flatnonzero(values != MISSING_ID)
+            order = rows[np.argsort(values[rows], kind="stable")]
+            self._sorted[col] = (values[order], order)
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(pd.read_csv(path, usecols=list(ID_COLUMNS), dtype=str))
+
+    def shared_arrays(self):
+        """
+        Every lookup array, keyed for publishing in shared memory (see shared_model.py).
+        """
+        arrays = {}
+        for col in ID_COLUMNS:
+            arrays[col] = self.columns[col]
+            arrays[f"{col}.keys"], arrays[f"{col}.order"] = self._sorted[col]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        mapping = cls.__new__(cls)
+        mapping.columns = {col: arrays[col] for col in ID_COLUMNS}
+        mapping._sorted = {col: (arrays[f"{col}.keys"], arrays[f"{col}.order"]) for col in ID_COLUMNS}
+        return mapping
+
+    def translate(self, ids, source, target):
+        """
+        Translate ids from the source column to the target column, preserving input order.
+        Returns (translated, found): translated holds MISSING_ID where found is False.
+        Ids that are not integers (None, NaN, junk strings) count as misses.
+        """
+        ids = pd.to_numeric(pd.Series(list(ids), dtype=object), errors="coerce")
+        ids = ids.fillna(MISSING_ID).to_numpy().astype(np.int64)
+        keys, order = self._sorted[source]
+        if len(keys) == 0:
+            return np.full(len(ids), MISSING_ID, dtype=np.int64), np.zeros(len(ids), dtype=bool)
+
+        positions = np.searchsorted(keys, ids).clip(0, len(keys) - 1)
+        translated = self.columns[target][order[positions]]
+        found = (keys[positions] == ids) & (ids != MISSING_ID) & (translated != MISSING_ID)
+        return np.where(found, translated, MISSING_ID), found
+
+    def movie_to_tmdb(self, movie_ids):
+        return self.translate(movie_ids, "movieId", "tmdbId")
+
+    def tmdb_to_movie(self, tmdb_ids):
+        return self.translate(tmdb_ids, "tmdbId", "movieId")
+
+    def movie_to_imdb(self, movie_ids):
+        return self.translate(movie_ids, "movieId", "imdbId")
+
+    def imdb_to_movie(self, imdb_ids):
+        return self.translate(imdb_ids, "imdbId", "movieId")
@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+try:
+    from .fileio import save_array_atomic, write_json_atomic
+except ImportError:
+    from fileio import save_array_atomic, write_json_atomic
+
+
+NEIGHBOR_ITEMS_FILE = "neighbor_items.npy"
+NEIGHBOR_SCORES_FILE = "neighbor_scores.npy"
+NEIGHBOR_META_FILE = "neighbors_meta.json"
+NEIGHBOR_BLOCK_ROWS = 1024  # the score block is NEIGHBOR_BLOCK_ROWS x n_items float32
+
+
+def normalized_factors(item_factors):
+    """
+    float32 copy of the item factors scaled to unit length, zero rows stay zero.
+    """
+    factors = np.asarray(item_factors, dtype=np.float32)
+    norms = np.linalg.norm(factors, axis=1, keepdims=True)
+    return factors / np.where(norms > 0, norms, 1.0)
+
+
+def nearest_items(unit_factors, queries, n_neighbors, exclude=None):
+    """
+    Top n_neighbors items by cosine similarity for each row of queries (unit vectors), best first.
+    exclude holds one item index per query that is never returned, normally the query item itself.
+    """
+    scores = np.dot(queries, unit_factors.T)
+    if exclude is not None:
+        scores[np.arange(len(queries)), exclude] = -np.inf
+    n_neighbors = min(n_neighbors, scores.shape[1] - (exclude is not None))
+    top = np.argpartition(scores, -n_neighbors, axis=1)[:, -n_neighbors:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(top_scores, axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class ItemNeighbors:
+    """
+    Precomputed top-N most similar items (cosine over the SVD item factors) for every item.
+    Row i of items / scores lists the neighbours of encoded item i, best first, as int32 indices
+    and float16 similarities, so a lookup is one row read from the (memory-mapped) arrays.
+    """
+
+    def __init__(self, items, scores, version=None):
+        self.items = items
+        self.scores = scores
+        self.version = version
+
+    @property
+    def n_neighbors(self):
+        return self.items.shape[1]
+
+    @classmethod
+    def build(cls, item_factors, n_neighbors=50, block_rows=NEIGHBOR_BLOCK_ROWS, version=None):
+        unit = normalized_factors(item_factors)
+        n_items = len(unit)
+        n_neighbors = min(n_neighbors, n_items - 1)
+        items = np.empty((n_items, n_neighbors), dtype=np.int32)
+        scores = np.empty((n_items, n_neighbors), dtype=np.float16)
+        for start in range(0, n_items, block_rows):
+            block = unit[start:start + block_rows]
+            top, top_scores = nearest_items(unit, block, n_neighbors, exclude=np.arange(start, start + len(block)))
+            items[start:start + len(block)] = top
+            scores[start:start + len(block)] = top_scores
+        return cls(items, scores, version)
+
+    def get(self, item_idx, k):
+        """
+        (items, scores) of the k nearest neighbours of encoded item item_idx.
+        """
+        return np.asarray(self.items[item_idx, :k]), np.asarray(self.scores[item_idx, :k], dtype=np.float32)
+
+    def save(self, path):
+        # Replaced atomically, serving processes memory-map these files; the metadata goes last
+        save_array_atomic(os.path.join(path, NEIGHBOR_ITEMS_FILE), self.items)
+        save_array_atomic(os.path.join(path, NEIGHBOR_SCORES_FILE), self.scores)
+        write_json_atomic(os.path.join(path, NEIGHBOR_META_FILE), {
+            "version": self.version, "n_items": int(self.items.shape[0]), "n_neighbors": int(self.n_neighbors),
+        }, indent=2)
+
+    @classmethod
+    def load(cls, path, version=None):
+        """
+        Memory-map the neighbour arrays in path. Returns None if there are none, or if they
+        were built for another model version than the given one.
+        """
+        meta_path = os.path.join(path, NEIGHBOR_META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        # Folding in ratings ("<version>+<n>") only changes user factors, the neighbours stay valid
+        if version is not None and meta["version"] != version.split("+")[0]:
+            print(f"⚠️ Item neighbours in {path} belong to model {meta['version']}, not {version}; ignoring them")
+            return None
+        items = np.load(os.path.join(path, NEIGHBOR_ITEMS_FILE), mmap_mode='r')
+        scores = np.load(os.path.join(path, NEIGHBOR_SCORES_FILE), mmap_mode='r')
+        if items.shape != scores.shape or items.shape[0] != meta["n_items"]:
+            raise ValueError(f"Item neighbour arrays in {path} do not match {NEIGHBOR_META_FILE}")
+        return cls(items, scores, meta["version"])
+
+
+if __name__ == "__main__":
+    from .model_based_cf import SVDRecommender
+
+    parser = argparse.ArgumentParser(description="Precompute the nearest neighbours of every item of an SVD model.")
+    parser.add_argument("model_dir", nargs="?", default=os.path.join(os.path.dirname(__file__), "svd_model_500"))
+    parser.add_argument("--neighbors", type=int, default=50)
+    parser.add_argument("--block-rows", type=int, default=NEIGHBOR_BLOCK_ROWS)
+    args = parser.parse_args()
+
+    recommender = SVDRecommender()
+    recommender.load(args.model_dir)
+    start = time.perf_counter()
+    neighbors = ItemNeighbors.build(recommender.item_factors, args.neighbors, args.block_rows,
+                                    version=recommender.version.split("+")[0])
+    neighbors.save(args.model_dir)
+    size_mb = (neighbors.items.nbytes + neighbors.scores.nbytes) / 2 ** 20
+    print(f"✅ {neighbors.n_neighbors} neighbours for {len(neighbors.items):,} items in "
+          f"{time.perf_counter() - start:.1f}s, {size_mb:.1f} MB in {args.model_dir}")
@@ -0,0 +1,113 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RecommendationNotReady(Exception):
+    """
+    Raised when a recommendation is requested before the artifacts finished loading.
+    """
+
+
+class RecommendationLoader:
+    """
+    Loads the recommendation artifacts (model data, datasets, SVD model, embeddings) in a
+    background thread so importing the package stays cheap, and records per-artifact state
+    and timings for the readiness endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "idle"  # idle -> loading -> ready | failed
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.artifacts = {}  # name -> {"state", "seconds", "error"}, in load order
+        self.module = None
+
+    def start(self, prepare=True):
+        """
+        Start warming up in a daemon thread; later calls are no-ops.
+        prepare=False skips prepare(), for pool workers whose parent already ran it.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._warm, args=(prepare,), name="recommendation-warmup",
+                                            daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state == "ready"
+
+    def prepare(self):
+        """
+        Download the model data and build every derived file (embeddings, Feather and tag index
+        caches) that utils only reads. Must run in one process at a time.
+        """
+        from .prepare_env import setup_model_data_auto
+        with self.stage("model_data"):
+            setup_model_data_auto()
+
+    def _warm(self, prepare):
+        try:
+            if prepare:
+                self.prepare()
+            # utils reports each artifact it loads through stage()
+            from . import utils
+            self.module = utils
+            self.state = "ready"
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "failed"
+            print(f"❌ Failed to load recommendation artifacts: {self.error}")
+        finally:
+            self.finished_at = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Record the load of one artifact; the yielded dict can carry extra details such as row counts.
+        """
+        artifact = {"state": "loading", "seconds": None, "error": None}
+        with self._lock:
+            self.artifacts[name] = artifact
+        start = time.perf_counter()
+        try:
+            yield artifact
+        except Exception as e:
+            artifact["state"] = "failed"
+            artifact["error"] = f"{type(e).__name__}: {e}"
+            raise
+        else:
+            artifact["state"] = "ready"
+        finally:
+            artifact["seconds"] = round(time.perf_counter() - start, 3)
+
+    def require(self):
+        """
+        The loaded utils module, or RecommendationNotReady while warming up (or after a failure).
+        """
+        if self.module is None:
+            raise RecommendationNotReady(f"Recommendation artifacts are {self.state}")
+        return self.module
+
+    def status(self):
+        with self._lock:
+            artifacts = {name: dict(artifact) for name, artifact in self.artifacts.items()}
+        end = self.finished_at or time.time()
+        return {
+            "ready": self.module is not None,
+            "state": self.state,
+            "error": self.error,
+            "elapsed_s": round(end - self.started_at, 3) if self.started_at else None,
+            "artifacts": artifacts,
+        }
+
+
+recommendation_loader = RecommendationLoader()
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+
+META_COLUMNS = ["id", "title", "release_date"]
+
+
+class MovieMetadataStore:
+    """
+    The served columns of movies_metadata.csv, indexed by integer TMDB id.
+    Lookups for a whole batch of ids are one searchsorted call plus array gathers.
+    """
+
+    def __init__(self, meta_df):
+        ids = pd.to_numeric(meta_df["id"], errors="coerce")
+        meta_df = meta_df[ids.notna()]
+        ids = ids[ids.notna()].to_numpy().astype(np.int64)
+
+        # Stable sort, then keep the first row of duplicated ids like the old DataFrame filter did
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        first = np.concatenate(([True], ids[1:] != ids[:-1]))
+        order = order[first]
+        self.ids = ids[first]
+        self.titles = meta_df["title"].to_numpy(dtype=object)[order]
+        self.release_dates = meta_df["release_date"].to_numpy(dtype=object)[order]
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(pd.read_csv(path, usecols=META_COLUMNS, dtype=str))
+
+    def get_many(self, tmdb_ids):
+        """
+        Metadata dicts for the given TMDB ids in input order, None where an id is unknown.
+        """
+        tmdb_ids = np.asarray(tmdb_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return [None] * len(tmdb_ids)
+        positions = np.searchsorted(self.ids, tmdb_ids).clip(0, len(self.ids) - 1)
+        found = self.ids[positions] == tmdb_ids
+        titles = self.titles[positions]
+        release_dates = self.release_dates[positions]
+        return [{
+            "id": str(tmdb_id),
+            "title": title if isinstance(title, str) else None,
+            "release_date": release_date if isinstance(release_date, str) else None,
+        } if hit else None for tmdb_id, hit, title, release_date in zip(tmdb_ids, found, titles, release_dates)]
+
+    def get(self, tmdb_id):
+        return self.get_many([tmdb_id])[0]
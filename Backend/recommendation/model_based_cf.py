@@ -4,7 +4,66 @@ import pandas as pd
 from sklearn.decomposition import TruncatedSVD
 from sklearn.preprocessing import LabelEncoder
 from scipy.sparse import csr_matrix
+import json
 import os
+import resource
+import shutil
+import time
+
+try:
+    from .ann_index import IVFIndex, ANN_INDEX_FILE, ANN_MIN_ITEMS
+    from .item_neighbors import ItemNeighbors
+    from .fileio import atomic_path, save_array_atomic, write_json_atomic
+except ImportError:  # run as a script from this directory (test_evaluate.py)
+    from ann_index import IVFIndex, ANN_INDEX_FILE, ANN_MIN_ITEMS
+    from item_neighbors import ItemNeighbors
+    from fileio import atomic_path, save_array_atomic, write_json_atomic
+
+
+RATINGS_CSV_FILE = Path(__file__).parent / "TheMoviesDataset" / "ratings.csv"
+MODEL_META_FILE = "model_meta.json"
+MODEL_FORMAT_VERSION = 2
+FACTORS_DTYPES = {"float32": np.float32, "float16": np.float16}
+SCORE_BLOCK_ROWS = 8192
+FOLD_IN_DELTA_FILE = "fold_in_delta.csv"
+TRAIN_CHUNK_ROWS = 2_000_000
+
+
+def lookup_sorted(classes, values):
+    """
+    Positions of values in the sorted array classes, plus a mask of which values were found.
+    """
+    values = np.asarray(values)
+    if len(classes) == 0:
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(classes, values).clip(0, len(classes) - 1)
+    return positions, classes[positions] == values
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first, without sorting the whole array.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        top_idx = np.argpartition(scores, -k)[-k:]
+    else:
+        top_idx = np.arange(len(scores))
+    return top_idx[np.argsort(scores[top_idx])[::-1]]
+
+
+def top_k_indices_rows(scores, k):
+    """
+    Row-wise top_k_indices for a 2-D score matrix.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    top_idx = np.argpartition(scores, -k, axis=1)[:, -k:]
+    order = np.argsort(np.take_along_axis(scores, top_idx, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(top_idx, order, axis=1)
 
 
 class SVDRecommender:
@@ -17,10 +76,35 @@ class SVDRecommender:
         self.movie_enc = LabelEncoder()
         self.movie_ids = None
         self.movies_df = None
-        self.original_ratings = pd.read_csv(Path(__file__).parent / "TheMoviesDataset/ratings.csv")
+        self._titles = None
+        self._norms = None
+        self.rating_counts = None
+        self.popularity_order = None
+        self._sorted_counts = None
+        self.seen_indptr = None
+        self.seen_indices = None
+        self._model_path = None
+        self._original_ratings = None
+        self.ann_index = None
+        self.item_neighbors = None
+        self._fold_in_log = []
+        self.version = None
+
+    @property
+    def original_ratings(self):
+        # Raw ratings are only read for training and evaluation, serving uses the compact arrays
+        if self._original_ratings is None:
+            print("Loading raw ratings from", RATINGS_CSV_FILE)
+            self._original_ratings = pd.read_csv(RATINGS_CSV_FILE)
+        return self._original_ratings
+
+    @original_ratings.setter
+    def original_ratings(self, ratings_df):
+        self._original_ratings = ratings_df
 
     def train(self, ratings_df, movies_df):
         self.movies_df = movies_df
+        self._titles = None
         self.original_ratings = ratings_df.copy()  # ✅ Added for filtering
 
         ratings_df = ratings_df.dropna(subset=["userId", "movieId", "rating"]).drop_duplicates()
@@ -37,135 +121,634 @@ class SVDRecommender:
             (ratings_df['rating'], (ratings_df['user_enc'], ratings_df['movie_enc'])),
             shape=(num_users, num_movies)
         )
-
+        self._fit_matrix(sparse_matrix)
+
+    def train_from_csv(self, ratings_path, movies_df, chunksize=TRAIN_CHUNK_ROWS):
+        """
+        Train straight from a ratings CSV without holding it as a DataFrame.
+        The file is streamed in chunks into int32 id / float32 rating buffers while the
+        sorted id encoders grow chunk by chunk; the CSR matrix is built once at the end.
+        Duplicate rows are dropped per chunk. Prints the peak memory of the process.
+        """
+        start = time.perf_counter()
+        self.movies_df = movies_df
+        self._titles = None
+        self._original_ratings = None  # read lazily if evaluation needs it
+
+        users, movies, ratings = [], [], []
+        user_classes = np.empty(0, dtype=np.int32)
+        movie_classes = np.empty(0, dtype=np.int32)
+        reader = pd.read_csv(ratings_path, usecols=["userId", "movieId", "rating"], chunksize=chunksize,
+                             dtype={"userId": "Int32", "movieId": "Int32", "rating": "float32"})
+        for chunk in reader:
+            chunk = chunk.dropna().drop_duplicates()
+            users.append(chunk["userId"].to_numpy(dtype=np.int32))
+            movies.append(chunk["movieId"].to_numpy(dtype=np.int32))
+            ratings.append(chunk["rating"].to_numpy(dtype=np.float32))
+            user_classes = np.union1d(user_classes, users[-1])
+            movie_classes = np.union1d(movie_classes, movies[-1])
+            print(f"Read {sum(len(r) for r in ratings):,} ratings...")
+
+        # Encode in place, chunk by chunk, then concatenate one column at a time
+        for i in range(len(users)):
+            users[i] = np.searchsorted(user_classes, users[i]).astype(np.int32)
+            movies[i] = np.searchsorted(movie_classes, movies[i]).astype(np.int32)
+        users = np.concatenate(users)
+        movies = np.concatenate(movies)
+        ratings = np.concatenate(ratings)
+
+        self.user_enc.classes_ = user_classes.astype(np.int64)
+        self.movie_enc.classes_ = movie_classes.astype(np.int64)
+        sparse_matrix = csr_matrix((ratings, (users, movies)), shape=(len(user_classes), len(movie_classes)))
+        del users, movies, ratings
+        self._fit_matrix(sparse_matrix)
+
+        # ru_maxrss is in KB on Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"✅ Trained on {sparse_matrix.nnz:,} ratings in {time.perf_counter() - start:.1f}s, "
+              f"peak memory {peak_mb:,.0f} MB")
+
+    def _fit_matrix(self, sparse_matrix):
+        self.version = time.strftime("trained-%Y%m%d-%H%M%S")
+        sparse_matrix.sum_duplicates()
         self.user_factors = self.svd.fit_transform(sparse_matrix)
         self.item_factors = self.svd.components_.T
         self.movie_ids = self.movie_enc.classes_
-
-    def recommend_existing_user(self, user_id, k=10, min_ratings=100, filter_seen=True):
-        if user_id not in self.user_enc.classes_:
+        self._set_popularity(np.bincount(sparse_matrix.indices, minlength=sparse_matrix.shape[1]))
+        self._set_seen(sparse_matrix)
+        self.item_neighbors = None  # built for the previous item factors
+        self.ann_index = None
+        self._norms = None
+        self._fold_in_log = []
+
+    def fold_in(self, ratings_df, record=True):
+        """
+        Absorb new ratings without retraining. User vectors are projections of the rating rows
+        onto the item factors (what TruncatedSVD.transform computes), so new users get
+        ratings @ item_factors and existing users get the same projection of their new ratings
+        added to their vector. Ratings of movies unknown to the model and re-ratings of movies
+        a user has already rated are skipped. Returns counts of what was applied.
+        """
+        ratings_df = ratings_df.dropna(subset=["userId", "movieId", "rating"])
+        ratings_df = ratings_df.drop_duplicates(subset=["userId", "movieId"], keep="last")
+        user_ids = ratings_df["userId"].to_numpy().astype(np.int64)
+        items, known_item = lookup_sorted(self.movie_enc.classes_, ratings_df["movieId"].to_numpy().astype(np.int64))
+        values = ratings_df["rating"].to_numpy().astype(np.float32)
+        stats = {"unknown_movies": int((~known_item).sum())}
+        user_ids, items, values = user_ids[known_item], items[known_item], values[known_item]
+
+        # New users get rows after the existing ones for now
+        classes = self.user_enc.classes_
+        n_old, n_items = len(classes), len(self.movie_enc.classes_)
+        users, known_user = lookup_sorted(classes, user_ids)
+        new_ids = np.unique(user_ids[~known_user])
+        users[~known_user] = n_old + np.searchsorted(new_ids, user_ids[~known_user])
+        n_users = n_old + len(new_ids)
+
+        seen_indptr, seen_indices = self._seen_index()
+        seen_indptr = np.concatenate([seen_indptr, np.full(len(new_ids), seen_indptr[-1])])
+        seen = csr_matrix((np.ones(len(seen_indices), dtype=np.int8), seen_indices, seen_indptr), shape=(n_users, n_items))
+        already_seen = np.asarray(seen[users, items]).ravel() > 0
+        stats["already_rated"] = int(already_seen.sum())
+        users, items, values = users[~already_seen], items[~already_seen], values[~already_seen]
+
+        delta = csr_matrix((values, (users, items)), shape=(n_users, n_items))
+        touched = np.unique(users)
+        user_factors = np.concatenate([
+            self.user_factors,
+            np.zeros((len(new_ids), self.user_factors.shape[1]), dtype=self.user_factors.dtype)
+        ])
+        user_factors[touched] += (delta[touched] @ self.item_factors).astype(user_factors.dtype)
+        seen = seen + csr_matrix((np.ones(len(users), dtype=np.int8), (users, items)), shape=(n_users, n_items))
+
+        if len(new_ids):
+            # Keep user_enc.classes_ sorted, as LabelEncoder expects
+            all_ids = np.concatenate([classes, new_ids])
+            order = np.argsort(all_ids, kind='stable')
+            self.user_enc.classes_ = all_ids[order]
+            user_factors = user_factors[order]
+            seen = seen[order]
+        self.user_factors = user_factors
+        self._set_seen(seen)
+        self._set_popularity(self.rating_counts + np.bincount(items, minlength=n_items))
+
+        if record:
+            self._fold_in_log.append(ratings_df[["userId", "movieId", "rating"]])
+        self.version = f"{self.version}+{len(users)}"  # rating counts changed
+        stats.update({
+            "new_users": len(new_ids),
+            "updated_users": int(len(touched) - len(new_ids)),
+            "ratings": len(users),
+        })
+        return stats
+
+    def save_delta(self, path):
+        """
+        Append the ratings folded in since the last save to the model's delta file.
+        load() replays it, which gives every loading process a private copy of user_factors;
+        the daily job writes the folded model with save_in_place() instead.
+        """
+        if not self._fold_in_log:
+            return
+        delta_path = os.path.join(path, FOLD_IN_DELTA_FILE)
+        pd.concat(self._fold_in_log).to_csv(delta_path, mode="a", index=False, header=not os.path.exists(delta_path))
+        self._fold_in_log = []
+
+    def build_ann_index(self, n_lists=256, n_probe=8):
+        """
+        Build an IVF index over the item factors; used for scoring once the catalog has at least ANN_MIN_ITEMS items.
+        """
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe).build(self.item_factors,
+                                                                          version=self.version.split("+")[0])
+        return self.ann_index
+
+    def build_item_neighbors(self, n_neighbors=50):
+        """
+        Precompute the n_neighbors most similar items of every item, see item_neighbors.py.
+        """
+        self.item_neighbors = ItemNeighbors.build(self.item_factors, n_neighbors, version=self.version.split("+")[0])
+        return self.item_neighbors
+
+    def similar_items(self, movie_id, k=20):
+        """
+        The k movies whose item factors are closest (cosine) to movie_id's, or None if the
+        model does not know the movie. Read from the precomputed neighbours when they hold
+        k per item, otherwise scored against the whole catalog.
+        """
+        encoded = self._encode_movies([movie_id])
+        if len(encoded) == 0:
+            return None
+        item_idx = int(encoded[0])
+        if self.item_neighbors is not None and k <= self.item_neighbors.n_neighbors:
+            top_idx, scores = self.item_neighbors.get(item_idx, k)
+        else:
+            norms = self._item_norms()
+            scores = self._score_items(self.item_factors[item_idx]) / np.maximum(norms * norms[item_idx], 1e-12)
+            scores[item_idx] = -np.inf
+            top_idx = top_k_indices(scores, k)
+            scores = scores[top_idx]
+        return pd.DataFrame({
+            'movieId': self.movie_ids[top_idx],
+            'title': self._item_titles()[top_idx],
+            'similarity': scores,
+            'rating_count': self.rating_counts[top_idx],
+        })
+
+    def recommend_existing_user(self, user_id, k=10, min_ratings=100, filter_seen=True, n_probe=None):
+        u_idx = self._encode_user(user_id)
+        if u_idx is None:
             raise ValueError("User not found in training data.")
 
-        u_idx = self.user_enc.transform([user_id])[0]
-        user_vec = self.user_factors[u_idx]
-        scores = np.dot(user_vec, self.item_factors.T)
-        scores = np.clip(scores, 1.0, 5.0)
+        scores = self._score_catalog(self.user_factors[u_idx], n_probe)
 
+        eligible = self.rating_counts >= min_ratings
         if filter_seen:
             # Remove movies already rated by the user
-            seen_movies = self.original_ratings[self.original_ratings['userId'] == user_id]['movieId'].values
-            seen_encs = [self.movie_enc.transform([m])[0] for m in seen_movies if m in self.movie_enc.classes_]
-            scores[seen_encs] = -np.inf  # Exclude seen movies
-
-        # Get top-K movie indices
-        top_idx = np.argsort(scores)[::-1]
-        top_movie_ids = self.movie_ids[top_idx]
-        top_scores = scores[top_idx]
-
-        # Assemble recommendations
-        recs_df = pd.DataFrame({
-            'movieId': top_movie_ids,
-            'predicted_rating': top_scores
-        }).merge(self.movies_df, on='movieId', how='left')
-
-        # Add rating count
-        rating_counts = self.original_ratings['movieId'].value_counts()
-        recs_df['rating_count'] = recs_df['movieId'].map(rating_counts)
+            eligible[self.seen_items(u_idx)] = False
 
-        # Filter by popularity only
-        filtered = recs_df[recs_df['rating_count'] >= min_ratings]
-        filtered = filtered.sort_values('predicted_rating', ascending=False)
+        top_idx, scores = self._rank(scores, eligible, k)
+        return self._recommendations_frame(top_idx, scores)
 
-        return filtered.head(k)[['movieId', 'title', 'predicted_rating', 'rating_count']]
-
-    def recommend_new_user(self, liked_movie_ids=None, k=10, min_ratings=100, refresh=False, sample_from_top_n=100):
+    def recommend_new_user(self, liked_movie_ids=None, k=10, min_ratings=100, refresh=False, sample_from_top_n=100,
+                           n_probe=None):
         if not liked_movie_ids:
-            rating_counts = self.original_ratings['movieId'].value_counts()
-            popular_movies = rating_counts[rating_counts >= min_ratings].index
-            df = self.movies_df[self.movies_df['movieId'].isin(popular_movies)].copy()
-            df['predicted_rating'] = 4.0  # Placeholder rating
-            df['rating_count'] = df['movieId'].map(rating_counts)
-
-            if refresh:
-                df = df.sample(n=min(k, len(df)), random_state=None)
-            else:
-                df = df.sort_values('rating_count', ascending=False).head(k)
-
-            return df[['movieId', 'title', 'predicted_rating', 'rating_count']]
+            return self._popular_frame(k, min_ratings, refresh)
 
         # Get encoded movie indices
-        liked_encs = [self.movie_enc.transform([mid])[0]
-                      for mid in liked_movie_ids if mid in self.movie_enc.classes_]
-
-        if not liked_movie_ids or len(liked_encs) == 0:
-            # fallback
-            rating_counts = self.original_ratings['movieId'].value_counts()
-            popular_movies = rating_counts[rating_counts >= min_ratings].head(k).index
-            df = self.movies_df[self.movies_df['movieId'].isin(popular_movies)].copy()
-            df['predicted_rating'] = 4.0  # Default score
-            df['rating_count'] = df['movieId'].map(rating_counts)
-
-            if refresh:
-                df = df.sample(n=min(k, len(df)), random_state=None)
-            else:
-                df = df.sort_values('rating_count', ascending=False).head(k)
+        liked_encs = self._encode_movies(liked_movie_ids)
 
-            return df[['movieId', 'title', 'predicted_rating', 'rating_count']]
+        if len(liked_encs) == 0:
+            # fallback, only the k most popular movies are shuffled on refresh
+            return self._popular_frame(k, min_ratings, refresh, pool_size=k)
 
         # Compute scores
-        user_vec = self.item_factors[liked_encs].mean(axis=0)
-        scores = np.dot(self.item_factors, user_vec)
-        scores[liked_encs] = -np.inf  # Don’t recommend liked ones
-        scores = np.clip(scores, 1.0, 5.0)
-
-        # Rank all
-        top_idx = np.argsort(scores)[::-1]
-        top_movie_ids = self.movie_ids[top_idx]
-        top_scores = scores[top_idx]
+        user_vec = self.item_factors[liked_encs].astype(np.float32).mean(axis=0)
+        scores = self._score_catalog(user_vec, n_probe)
 
-        recs_df = pd.DataFrame({'movieId': top_movie_ids, 'predicted_rating': top_scores})
-        recs_df = recs_df.merge(self.movies_df, on='movieId', how='left')
+        # Popularity filter, and don't recommend liked ones
+        eligible = self.rating_counts >= min_ratings
+        eligible[liked_encs] = False
 
-        # Add popularity filter
-        rating_counts = self.original_ratings['movieId'].value_counts()
-        recs_df['rating_count'] = recs_df['movieId'].map(rating_counts)
-        recs_df = recs_df[recs_df['rating_count'] >= min_ratings]
-
-        # Refresh logic
+        # Refresh logic: sample from a wider pool of the best candidates
+        top_idx, scores = self._rank(scores, eligible, sample_from_top_n if refresh else k)
+        if refresh:
+            pick = np.random.choice(len(top_idx), size=min(k, len(top_idx)), replace=False)
+            top_idx = top_idx[pick]
+
+        return self._recommendations_frame(top_idx, scores)
+
+    def recommend_batch(self, liked_movie_ids_lists=None, user_ids=None, k=10, min_ratings=100,
+                        filter_seen=True, block_size=256):
+        """
+        Recommend for many profiles at once: liked-movie lists (new users) and/or existing userIds.
+        Profiles are scored block_size rows at a time with one matrix-matrix product per block.
+        Yields (kind, position, recommendations) where kind is "liked" or "user" and position
+        indexes the matching input list. recommendations is None for unknown users.
+        """
+        profiles = [("liked", i, ids) for i, ids in enumerate(liked_movie_ids_lists or [])]
+        profiles += [("user", i, user_id) for i, user_id in enumerate(user_ids or [])]
+        eligible = self.rating_counts >= min_ratings
+
+        for start in range(0, len(profiles), block_size):
+            block = profiles[start:start + block_size]
+            results = [None] * len(block)
+            vecs, masked, rows = [], [], []
+            for j, (kind, _, value) in enumerate(block):
+                if kind == "liked":
+                    liked_encs = self._encode_movies(value)
+                    if len(liked_encs) == 0:
+                        # Same fallback as recommend_new_user
+                        results[j] = self._popular_frame(k, min_ratings, refresh=False)
+                        continue
+                    vecs.append(self.item_factors[liked_encs].astype(np.float32).mean(axis=0))
+                    masked.append(liked_encs)
+                else:
+                    u_idx = self._encode_user(value)
+                    if u_idx is None:
+                        continue
+                    vecs.append(self.user_factors[u_idx])
+                    if filter_seen:
+                        masked.append(self.seen_items(u_idx))
+                    else:
+                        masked.append([])
+                rows.append(j)
+
+            if rows:
+                scores = np.where(eligible, np.clip(self._score_items(np.vstack(vecs)), 1.0, 5.0), -np.inf)
+                for row, items in enumerate(masked):
+                    scores[row, items] = -np.inf
+                top_idx = top_k_indices_rows(scores, k)
+                for row, j in enumerate(rows):
+                    row_idx = top_idx[row][np.isfinite(scores[row, top_idx[row]])]
+                    results[j] = self._recommendations_frame(row_idx, scores[row])
+
+            for (kind, position, _), recommendations in zip(block, results):
+                yield kind, position, recommendations
+
+    def _encode_movies(self, movie_ids):
+        """
+        Encoded indices of the given MovieLens ids, skipping ids unknown to the model.
+        Integral floats such as 3.0 (ids that went through a NaN-bearing join) count as ids;
+        None, NaN, 3.5 and junk strings are skipped.
+        """
+        ids = pd.to_numeric(pd.Series(list(movie_ids), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        movie_ids = ids[np.isfinite(ids) & (ids == np.round(ids))].astype(np.int64)
+        positions, found = lookup_sorted(self.movie_enc.classes_, movie_ids)
+        return positions[found]
+
+    def _score_items(self, user_vecs):
+        """
+        Dot products of every item factor row with one user vector (1-D) or a block of them (2-D).
+        float16 factors are upcast one block at a time so the matrix is never copied whole.
+        """
+        user_vecs = np.asarray(user_vecs, dtype=np.float32)
+        if self.item_factors.dtype != np.float16:
+            return np.dot(user_vecs, self.item_factors.T)
+
+        scores = np.empty(user_vecs.shape[:-1] + (len(self.item_factors),), dtype=np.float32)
+        for start in range(0, len(self.item_factors), SCORE_BLOCK_ROWS):
+            block = self.item_factors[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[..., start:start + len(block)] = np.dot(user_vecs, block.T)
+        return scores
+
+    def _score_catalog(self, user_vec, n_probe=None):
+        """
+        Scores for the whole catalog. With an ANN index and a large enough catalog only the
+        items in the probed lists are scored, all others get -inf.
+        n_probe is the recall/latency knob of the index (None uses the index default).
+        """
+        if self.ann_index is None or len(self.item_factors) < ANN_MIN_ITEMS:
+            return self._score_items(user_vec)
+
+        items, item_scores = self.ann_index.candidates(self.item_factors, user_vec, n_probe)
+        scores = np.full(len(self.item_factors), -np.inf, dtype=np.float32)
+        scores[items] = item_scores
+        return scores
+
+    def _rank(self, scores, eligible, k):
+        """
+        Clip the raw scores to the rating scale and pick the k best eligible items.
+        Returns the selected item indices (best first) and the clipped scores.
+        """
+        eligible = eligible & (scores > -np.inf)  # items skipped by the ANN index
+        scores = np.where(eligible, np.clip(scores, 1.0, 5.0), -np.inf)
+        top_idx = top_k_indices(scores, k)
+        return top_idx[np.isfinite(scores[top_idx])], scores
+
+    def _set_popularity(self, rating_counts, popularity_order=None):
+        """
+        Store the per-item rating counts and the item indices ordered from most to least rated.
+        """
+        self.rating_counts = np.asarray(rating_counts, dtype=np.int64)
+        if popularity_order is None:
+            popularity_order = np.argsort(-self.rating_counts, kind='stable')
+        self.popularity_order = np.asarray(popularity_order, dtype=np.int64)
+        self._sorted_counts = self.rating_counts[self.popularity_order]
+
+    def _popular_frame(self, k, min_ratings, refresh, pool_size=None):
+        # Items with at least min_ratings ratings form a prefix of the popularity order
+        n_eligible = int(np.searchsorted(-self._sorted_counts, -min_ratings, side='right'))
+        pool = self.popularity_order[:n_eligible if pool_size is None else min(pool_size, n_eligible)]
         if refresh:
-            pool = recs_df.head(sample_from_top_n)
-            recs_df = pool.sample(n=min(k, len(pool)), random_state=None)
+            pool = np.random.choice(pool, size=min(k, len(pool)), replace=False)
         else:
-            recs_df = recs_df.head(k)
-
-        return recs_df[['movieId', 'title', 'predicted_rating', 'rating_count']]
-
-    def save(self, path):
+            pool = pool[:k]
+
+        scores = np.full(len(self.movie_ids), 4.0)  # Placeholder rating
+        return self._recommendations_frame(pool, scores)
+
+    def _set_seen(self, sparse_matrix):
+        """
+        Keep the rated items of every user as CSR arrays over encoded items.
+        """
+        sparse_matrix = sparse_matrix.tocsr()
+        sparse_matrix.sum_duplicates()
+        self.seen_indptr = sparse_matrix.indptr.astype(np.int64)
+        self.seen_indices = sparse_matrix.indices.astype(np.int32)
+
+    def seen_items(self, u_idx):
+        """
+        Encoded items rated by the user with encoded index u_idx, read straight from the CSR arrays.
+        """
+        seen_indptr, seen_indices = self._seen_index()
+        return seen_indices[seen_indptr[u_idx]:seen_indptr[u_idx + 1]]
+
+    def _seen_index(self):
+        # Loaded on first use, most serving requests never need them
+        if self.seen_indptr is None:
+            indptr_path = os.path.join(self._model_path, "seen_indptr.npy")
+            indices_path = os.path.join(self._model_path, "seen_indices.npy")
+            if os.path.exists(indptr_path):
+                self.seen_indptr = np.load(indptr_path)
+                self.seen_indices = np.load(indices_path)
+            else:
+                # Models saved before the seen arrays existed: build them once and store them
+                ratings = self.original_ratings
+                users, known_user = lookup_sorted(self.user_enc.classes_, ratings['userId'].to_numpy())
+                items, known_item = lookup_sorted(self.movie_enc.classes_, ratings['movieId'].to_numpy())
+                known = known_user & known_item
+                self._set_seen(csr_matrix(
+                    (np.ones(int(known.sum()), dtype=np.int8), (users[known], items[known])),
+                    shape=(len(self.user_enc.classes_), len(self.movie_enc.classes_))
+                ))
+                try:
+                    # indptr last, its presence means both files are complete
+                    save_array_atomic(indices_path, self.seen_indices)
+                    save_array_atomic(indptr_path, self.seen_indptr)
+                except OSError as e:
+                    print(f"⚠️ Could not store the seen-items index in {self._model_path}: {e}")
+                self._original_ratings = None  # re-read lazily if evaluation needs them
+        return self.seen_indptr, self.seen_indices
+
+    def _encode_user(self, user_id):
+        """
+        Encoded index of a userId, or None if the user is unknown to the model.
+        """
+        positions, found = lookup_sorted(self.user_enc.classes_, [user_id])
+        return int(positions[0]) if found[0] else None
+
+    def _item_titles(self):
+        """
+        Movie titles aligned to movie_enc.classes_, built once per model.
+        """
+        if self._titles is None:
+            titles = self.movies_df.drop_duplicates('movieId').set_index('movieId')['title']
+            self._titles = titles.reindex(self.movie_ids).to_numpy()
+        return self._titles
+
+    def _item_norms(self):
+        # Built on the first similar_items() call without precomputed neighbours
+        if self._norms is None:
+            self._norms = np.concatenate([
+                np.linalg.norm(self.item_factors[start:start + SCORE_BLOCK_ROWS].astype(np.float32), axis=1)
+                for start in range(0, len(self.item_factors), SCORE_BLOCK_ROWS)
+            ])
+        return self._norms
+
+    def _recommendations_frame(self, top_idx, scores):
+        # Only the final rows ever touch the movie metadata
+        return pd.DataFrame({
+            'movieId': self.movie_ids[top_idx],
+            'title': self._item_titles()[top_idx],
+            'predicted_rating': scores[top_idx],
+            'rating_count': self.rating_counts[top_idx],
+        })
+
+    def save(self, path, factors_dtype="float32"):
+        """
+        Save the model. Factors are stored as float32 (or float16) so that load() can memory-map them.
+        """
+        if factors_dtype not in FACTORS_DTYPES:
+            raise ValueError(f"Unsupported factors dtype: {factors_dtype}")
+        dtype = FACTORS_DTYPES[factors_dtype]
+
+        # Every file is replaced atomically: serving processes may have the old ones memory-mapped
         os.makedirs(path, exist_ok=True)
-        np.save(os.path.join(path, "user_factors.npy"), self.user_factors)
-        np.save(os.path.join(path, "item_factors.npy"), self.item_factors)
-        np.save(os.path.join(path, "movie_ids.npy"), self.movie_ids)
-        np.save(os.path.join(path, "user_enc_classes.npy"), self.user_enc.classes_)
-        np.save(os.path.join(path, "movie_enc_classes.npy"), self.movie_enc.classes_)
-        self.movies_df.to_csv(os.path.join(path, "movies.csv"), index=False)
+        save_array_atomic(os.path.join(path, "user_factors.npy"), np.ascontiguousarray(self.user_factors, dtype=dtype))
+        save_array_atomic(os.path.join(path, "item_factors.npy"), np.ascontiguousarray(self.item_factors, dtype=dtype))
+        save_array_atomic(os.path.join(path, "movie_ids.npy"), self.movie_ids)
+        save_array_atomic(os.path.join(path, "user_enc_classes.npy"), self.user_enc.classes_)
+        save_array_atomic(os.path.join(path, "movie_enc_classes.npy"), self.movie_enc.classes_)
+        save_array_atomic(os.path.join(path, "rating_counts.npy"), self.rating_counts)
+        save_array_atomic(os.path.join(path, "popularity_order.npy"), self.popularity_order)
+        seen_indptr, seen_indices = self._seen_index()
+        save_array_atomic(os.path.join(path, "seen_indptr.npy"), seen_indptr)
+        save_array_atomic(os.path.join(path, "seen_indices.npy"), seen_indices)
+        with atomic_path(os.path.join(path, "movies.csv")) as tmp_path:
+            self.movies_df.to_csv(tmp_path, index=False)
+
+        meta = {
+            "format_version": MODEL_FORMAT_VERSION,
+            "factors_dtype": factors_dtype,
+            "n_users": int(self.user_factors.shape[0]),
+            "n_items": int(self.item_factors.shape[0]),
+            "n_components": int(self.item_factors.shape[1]),
+            "version": self.version,
+        }
+        write_json_atomic(os.path.join(path, MODEL_META_FILE), meta, indent=2)
+        if self.ann_index is not None:
+            self.ann_index.save(path)
+        elif os.path.exists(os.path.join(path, ANN_INDEX_FILE)):
+            os.remove(os.path.join(path, ANN_INDEX_FILE))  # clusters of the previous item factors
+        if self.item_neighbors is not None:
+            self.item_neighbors.save(path)
+        # Folded-in ratings are part of the saved factors now
+        if os.path.exists(os.path.join(path, FOLD_IN_DELTA_FILE)):
+            os.remove(os.path.join(path, FOLD_IN_DELTA_FILE))
+        self._fold_in_log = []
+
+    def save_in_place(self, path, factors_dtype=None, backup_suffix=".previous"):
+        """
+        save() into a sibling directory and rename it over path, so processes that memory-map
+        path keep reading complete files and the next load() maps the new ones.
+        The replaced directory is kept as <path><backup_suffix>.
+        """
+        path = os.path.normpath(path)
+        if factors_dtype is None:
+            factors_dtype = "float16" if self.item_factors.dtype == np.float16 else "float32"
+        new_path, backup_path = f"{path}.saving", f"{path}{backup_suffix}"
+        shutil.rmtree(new_path, ignore_errors=True)
+        self.save(new_path, factors_dtype=factors_dtype)
+        shutil.rmtree(backup_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, backup_path)
+        os.rename(new_path, path)
 
     def load(self, path):
-        self.user_factors = np.load(os.path.join(path, "user_factors.npy"))
-        self.item_factors = np.load(os.path.join(path, "item_factors.npy"))
+        """
+        Load a saved model. Factor matrices are memory-mapped read-only, so every
+        process that loads the same directory shares one page-cache copy.
+        """
+        meta_path = os.path.join(path, MODEL_META_FILE)
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("format_version") != MODEL_FORMAT_VERSION:
+                raise ValueError(f"Unsupported model format version {meta.get('format_version')} in {path}")
+
+        self.user_factors = self._load_factors(path, "user_factors.npy", meta, "n_users")
+        self.item_factors = self._load_factors(path, "item_factors.npy", meta, "n_items")
+        if self.user_factors.shape[1] != self.item_factors.shape[1]:
+            raise ValueError(f"User and item factors disagree on the number of components in {path}")
+        self.n_components = self.item_factors.shape[1]
+        if meta is not None and meta.get("version"):
+            self.version = meta["version"]
+        else:
+            mtime = os.path.getmtime(os.path.join(path, "item_factors.npy"))
+            self.version = f"{os.path.basename(os.path.normpath(path))}-{int(mtime)}"
         self.movie_ids = np.load(os.path.join(path, "movie_ids.npy"))
         self.user_enc.classes_ = np.load(os.path.join(path, "user_enc_classes.npy"), allow_pickle=True)
         self.movie_enc.classes_ = np.load(os.path.join(path, "movie_enc_classes.npy"), allow_pickle=True)
+        if len(self.user_enc.classes_) != len(self.user_factors) or len(self.movie_enc.classes_) != len(self.item_factors):
+            raise ValueError(f"Encoders do not match the factor matrices in {path}")
         self.movies_df = pd.read_csv(os.path.join(path, "movies.csv"))
+        self._titles = None
+        self._norms = None
+        self._model_path = path
+        self.seen_indptr = None
+        self.seen_indices = None
+        self.ann_index = IVFIndex.load(path, self.version, len(self.item_factors))
+        self.item_neighbors = ItemNeighbors.load(path, self.version)
+
+        counts_path = os.path.join(path, "rating_counts.npy")
+        if os.path.exists(counts_path):
+            self._set_popularity(np.load(counts_path), np.load(os.path.join(path, "popularity_order.npy")))
+        else:
+            # Models saved before the popularity arrays existed: derive them and the seen index
+            # from ratings.csv once, store them, and don't keep the raw ratings in memory
+            rating_counts = self.original_ratings['movieId'].value_counts()
+            self._set_popularity(rating_counts.reindex(self.movie_ids, fill_value=0).to_numpy())
+            self._seen_index()
+            try:
+                save_array_atomic(os.path.join(path, "popularity_order.npy"), self.popularity_order)
+                save_array_atomic(counts_path, self.rating_counts)
+            except OSError as e:
+                print(f"⚠️ Could not store the popularity arrays in {path}: {e}")
+            self._original_ratings = None
+
+        delta_path = os.path.join(path, FOLD_IN_DELTA_FILE)
+        self._fold_in_log = []
+        if os.path.exists(delta_path):
+            stats = self.fold_in(pd.read_csv(delta_path), record=False)
+            print(f"Replayed folded-in ratings from {delta_path}: {stats}")
+
+    def shared_arrays(self):
+        """
+        The serving arrays, keyed for publishing in shared memory (see shared_model.py).
+        """
+        seen_indptr, seen_indices = self._seen_index()
+        return {
+            "user_factors": self.user_factors,
+            "item_factors": self.item_factors,
+            "movie_ids": self.movie_ids,
+            "user_classes": self.user_enc.classes_,
+            "movie_classes": self.movie_enc.classes_,
+            "rating_counts": self.rating_counts,
+            "popularity_order": self.popularity_order,
+            "seen_indptr": seen_indptr,
+            "seen_indices": seen_indices,
+        }
+
+    @classmethod
+    def from_shared(cls, arrays, version, path):
+        """
+        A recommender over arrays published by another process, e.g. read-only shared memory views.
+        Titles, the ANN index and the item neighbours still come from the model directory; folded-in ratings are
+        already part of the published arrays.
+        """
+        recommender = cls()
+        recommender.user_factors = arrays["user_factors"]
+        recommender.item_factors = arrays["item_factors"]
+        recommender.n_components = recommender.item_factors.shape[1]
+        recommender.movie_ids = arrays["movie_ids"]
+        recommender.user_enc.classes_ = arrays["user_classes"]
+        recommender.movie_enc.classes_ = arrays["movie_classes"]
+        recommender._set_popularity(arrays["rating_counts"], arrays["popularity_order"])
+        recommender.seen_indptr = arrays["seen_indptr"]
+        recommender.seen_indices = arrays["seen_indices"]
+        recommender.movies_df = pd.read_csv(os.path.join(path, "movies.csv"))
+        recommender.ann_index = IVFIndex.load(path, version, len(recommender.item_factors))
+        recommender.item_neighbors = ItemNeighbors.load(path, version)
+        recommender._model_path = path
+        recommender.version = version
+        return recommender
+
+    @staticmethod
+    def _load_factors(path, file_name, meta, rows_key):
+        factors = np.load(os.path.join(path, file_name), mmap_mode='r')
+        if factors.ndim != 2:
+            raise ValueError(f"{file_name} in {path} is not a 2-D matrix")
+        if meta is None:
+            # Models saved before model_meta.json existed (float64 factors)
+            return factors
+        if factors.dtype != FACTORS_DTYPES[meta["factors_dtype"]]:
+            raise ValueError(f"{file_name} in {path} has dtype {factors.dtype}, expected {meta['factors_dtype']}")
+        if factors.shape != (meta[rows_key], meta["n_components"]):
+            raise ValueError(f"{file_name} in {path} has shape {factors.shape}, "
+                             f"expected {(meta[rows_key], meta['n_components'])}")
+        return factors
+
+
+def migrate_model(path, factors_dtype="float32"):
+    """
+    Re-save a model directory in the current format (model_meta.json, float32 factors,
+    popularity and seen arrays). The new files are written next to it and swapped in with a
+    rename (save_in_place); the old directory is kept as <path>.legacy.
+    """
+    path = os.path.normpath(path)
+    recommender = SVDRecommender()
+    recommender.load(path)
+    recommender.save_in_place(path, factors_dtype=factors_dtype, backup_suffix=".legacy")
+    print(f"✅ Migrated {path} to format {MODEL_FORMAT_VERSION} ({factors_dtype}), the old model is in {path}.legacy")
 
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--migrate":
+        # One-off: python model_based_cf.py --migrate svd_model_500/
+        migrate_model(sys.argv[2])
+        sys.exit(0)
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--fold-in":
+        # Daily update: python model_based_cf.py --fold-in new_ratings.csv
+        # The folded factors are saved, so serving processes memory-map them instead of
+        # replaying the ratings into private copies; POST /admin/model/reload picks them up
+        recommender = SVDRecommender()
+        recommender.load("svd_model_500/")
+        print("Folded in:", recommender.fold_in(pd.read_csv(sys.argv[2])))
+        recommender.save_in_place("svd_model_500/")
+        sys.exit(0)
+
     # Load data
-    ratings_df = pd.read_csv("TheMoviesDataset/ratings.csv")
     movies_df = pd.read_csv("TheMoviesDataset/movies.csv")
 
-    # Train
+    # Train, streaming the ratings file
     recommender = SVDRecommender(n_components=500)
-    recommender.train(ratings_df, movies_df)
+    recommender.train_from_csv("TheMoviesDataset/ratings.csv", movies_df)
+    # "More like this" lists, served by GET /movies/{title}/similar
+    recommender.build_item_neighbors()
 
-    # Save model
-    recommender.save("svd_model_500/")
+    # Save model next to the served one and swap it in; POST /admin/model/reload loads it
+    recommender.save_in_place("svd_model_500/")
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from .model_based_cf import SVDRecommender
+
+
+# How many past swaps status() reports
+HISTORY_SIZE = 10
+
+
+def smoke_test(recommender):
+    """
+    Run one cold-start and one liked-movies query against a freshly loaded model.
+    Raises ValueError if either returns nothing or non-finite scores.
+    """
+    popular = recommender.recommend_new_user(liked_movie_ids=[], k=10, min_ratings=0)
+    if popular.empty:
+        raise ValueError("Smoke query returned no popular movies")
+    liked = popular['movieId'].head(3).tolist()
+    results = recommender.recommend_new_user(liked_movie_ids=liked, k=10, min_ratings=0)
+    if results.empty or not np.isfinite(results['predicted_rating'].to_numpy(dtype=np.float64)).all():
+        raise ValueError(f"Smoke query for {liked} returned no or non-finite scores")
+
+
+class ModelRegistry:
+    """
+    Holds the active SVD model and replaces it without a restart: reload() loads a model
+    directory in a background thread, smoke-tests it and swaps the reference in one assignment.
+    Requests that already took `current` keep using the old model until they finish.
+
+    A successful reload is recorded in pointer_file, so other processes serving the same model
+    (the process pool workers) load the same directory on their next sync().
+    """
+
+    def __init__(self, pointer_file=None):
+        self.pointer_file = pointer_file
+        self.current = None
+        self.path = None
+        self.loaded_at = None
+        self.on_swap = []  # callables(recommender), e.g. clearing caches keyed by the old version
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pointer_mtime = None
+        self.pending = None  # {"path", "state", "error", "started_at"} of the last reload
+        self.history = []
+
+    def active_path(self, default):
+        """
+        The directory recorded by the last successful reload, or default.
+        """
+        if self.pointer_file and os.path.exists(self.pointer_file):
+            self._pointer_mtime = os.stat(self.pointer_file).st_mtime_ns
+            with open(self.pointer_file) as f:
+                path = json.load(f)["path"]
+            if os.path.isdir(path):
+                return path
+            print(f"⚠️ {self.pointer_file} names {path}, which no longer exists; loading {default}")
+        return str(default)
+
+    def load(self, path, publish=False):
+        """
+        Load and smoke-test the model in path, then make it current. Blocks until done.
+        """
+        recommender = SVDRecommender()
+        recommender.load(path)
+        smoke_test(recommender)
+        self.swap(recommender, path)
+        if publish:
+            self._write_pointer(str(path), recommender.version)
+        return recommender
+
+    def swap(self, recommender, path):
+        with self._lock:
+            previous = self.current
+            self.current = recommender
+            self.path = str(path)
+            self.loaded_at = time.time()
+            self.history.append({
+                "version": recommender.version,
+                "previous_version": previous.version if previous is not None else None,
+                "path": self.path,
+                "at": self.loaded_at,
+            })
+            del self.history[:-HISTORY_SIZE]
+        for callback in self.on_swap:
+            callback(recommender)
+        print(f"✅ Active model is now {recommender.version} ({path})")
+
+    def reload(self, path, publish=True):
+        """
+        Start loading path in the background; returns False if a reload is already running.
+        With publish, a successful reload is written to pointer_file for the other processes.
+        """
+        path = str(path)
+        if not os.path.isdir(path):
+            raise ValueError(f"Model directory {path} does not exist")
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.pending = {"path": path, "state": "loading", "error": None, "started_at": time.time()}
+            self._thread = threading.Thread(target=self._reload, args=(path, publish, self.pending),
+                                            name="model-reload", daemon=True)
+            self._thread.start()
+        return True
+
+    def _reload(self, path, publish, pending):
+        try:
+            self.load(path, publish)
+            pending["state"] = "ready"
+        except Exception as e:
+            pending["error"] = f"{type(e).__name__}: {e}"
+            pending["state"] = "failed"
+            print(f"❌ Failed to reload the model from {path}: {pending['error']}")
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.pending is None or self.pending["state"] == "ready"
+
+    def _write_pointer(self, path, version):
+        if not self.pointer_file:
+            return
+        tmp_path = f"{self.pointer_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"path": path, "version": version, "at": time.time()}, f)
+        os.replace(tmp_path, self.pointer_file)
+        self._pointer_mtime = os.stat(self.pointer_file).st_mtime_ns
+
+    def sync(self):
+        """
+        Start loading the directory another process recorded in pointer_file, if it changed.
+        Cheap enough (one stat) to call on every request.
+        """
+        if not self.pointer_file:
+            return
+        try:
+            mtime = os.stat(self.pointer_file).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._pointer_mtime:
+            return
+        with open(self.pointer_file) as f:
+            pointer = json.load(f)
+        if self.current is not None and pointer["version"] == self.current.version:
+            self._pointer_mtime = mtime
+            return
+        try:
+            started = self.reload(pointer["path"], publish=False)
+        except ValueError as e:
+            # The directory was deleted, or is mid-rename in save_in_place: keep the current
+            # model and wait for the pointer to change again
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self.pending = {"path": pointer["path"], "state": "failed", "error": f"ValueError: {e}",
+                                    "started_at": time.time()}
+            self._pointer_mtime = mtime
+            print(f"⚠️ {self.pointer_file} names {pointer['path']}, which cannot be loaded; keeping the current model")
+            return
+        if started:
+            self._pointer_mtime = mtime
+        # else a reload is still running, look again on a later request
+
+    def status(self):
+        with self._lock:
+            return {
+                "version": self.current.version if self.current is not None else None,
+                "path": self.path,
+                "loaded_at": self.loaded_at,
+                "reload": dict(self.pending) if self.pending else None,
+                "history": list(self.history),
+                "pid": os.getpid(),
+            }
@@ -48,15 +48,57 @@ def extract_tmdb_filter_options(df, save_dir=None):
 
 
 
+# Clean MovieLens titles for better matching (move "The" from end to front)
+def normalize_movielens_title(title):
+    match = re.match(r"^(.*),\s*The\s*(\(\d{4}\))?$", title)
+    if match:
+        main = match.group(1).strip()
+        year = match.group(2) if match.group(2) else ""
+        return f"The {main}".strip().lower()
+    return re.sub(r"\(\d{4}\)", "", title).strip().lower()
+
+
+class TitleIndex:
+    """
+    Read-only TMDB -> MovieLens matcher, built once and safe to share between threads.
+    A TMDB id is translated through links.csv (an IdMapping) when possible, otherwise the
+    lower-cased TMDB title is looked up among the normalized MovieLens titles.
+    """
+
+    def __init__(self, movielens_df, id_mapping=None):
+        self.id_mapping = id_mapping
+        self.by_title = {}
+        for title, movie_id in zip(movielens_df['title'], movielens_df['movieId']):
+            # first MovieLens movie wins, as with the old DataFrame filter
+            self.by_title.setdefault(normalize_movielens_title(str(title)), movie_id)
+
+    def match(self, tmdb_id, title):
+        if self.id_mapping is not None and tmdb_id is not None:
+            movie_ids, found = self.id_mapping.tmdb_to_movie([tmdb_id])
+            if found[0]:
+                return int(movie_ids[0])
+        return self.by_title.get(str(title).strip().lower())
+
+    def lookup(self, title):
+        """
+        MovieLens id for a title written either way, "The Matrix" or "Matrix, The (1999)".
+        """
+        return self.by_title.get(normalize_movielens_title(str(title).strip()))
+
+
 def build_liked_list_from_preferences(tmdb_df,
                                       movielens_df,
                                       genres=None,
                                       keywords=None,
-                                      sample_size=10):
+                                      sample_size=10,
+                                      tag_index=None,
+                                      title_index=None):
     """
     Simulate a cold-start liked list from user-selected filters.
     Returns a list of MovieLens movieIds using title matching.
     Only filters on genres and keywords.
+    With a TagIndex built from tmdb_df the candidates come from its posting lists
+    instead of a scan over every row. Pass a prebuilt TitleIndex to skip building one per call.
     """
     genres = genres or []
     keywords = keywords or []
@@ -65,21 +107,25 @@ def build_liked_list_from_preferences(tmdb_df,
     genres = set(g.lower() for g in genres)
     keywords = set(k.lower() for k in keywords)
 
-    # Ensure text columns are strings
-    tmdb_df['genres'] = tmdb_df['genres'].astype(str)
-    tmdb_df['keywords'] = tmdb_df['keywords'].astype(str)
+    if tag_index is not None:
+        rows = tag_index.filter_rows(genres, keywords)
+        filtered = tmdb_df if rows is None else tmdb_df.iloc[rows]
+    else:
+        # Ensure text columns are strings
+        tmdb_df['genres'] = tmdb_df['genres'].astype(str)
+        tmdb_df['keywords'] = tmdb_df['keywords'].astype(str)
 
-    def is_representative(row):
-        genre_text = row['genres'].lower()
-        keyword_text = row['keywords'].lower()
+        def is_representative(row):
+            genre_text = row['genres'].lower()
+            keyword_text = row['keywords'].lower()
 
-        genre_match = any(g in genre_text for g in genres) if genres else True
-        keyword_match = any(k in keyword_text for k in keywords) if keywords else True
+            genre_match = any(g in genre_text for g in genres) if genres else True
+            keyword_match = any(k in keyword_text for k in keywords) if keywords else True
 
-        return genre_match and keyword_match
+            return genre_match and keyword_match
 
-    # Filter TMDB movies
-    filtered = tmdb_df[tmdb_df.apply(is_representative, axis=1)]
+        # Filter TMDB movies
+        filtered = tmdb_df[tmdb_df.apply(is_representative, axis=1)]
     print(f"🎯 Filtered down to {len(filtered)} candidate movies from TMDB.")
 
     if filtered.empty:
@@ -89,31 +135,22 @@ def build_liked_list_from_preferences(tmdb_df,
     # Sample some candidates
     sampled = filtered.sample(n=min(sample_size, len(filtered)), random_state=42)
 
-    # Clean MovieLens titles for better matching (move "The" from end to front)
-    def normalize_movielens_title(title):
-        match = re.match(r"^(.*),\s*The\s*(\(\d{4}\))?$", title)
-        if match:
-            main = match.group(1).strip()
-            year = match.group(2) if match.group(2) else ""
-            return f"The {main}".strip().lower()
-        return re.sub(r"\(\d{4}\)", "", title).strip().lower()
-
-    movielens_df['clean_title'] = movielens_df['title'].apply(normalize_movielens_title)
+    if title_index is None:
+        title_index = TitleIndex(movielens_df)
 
     # Match titles
     liked_ids = []
 
     print("\n👍 Simulated liked movies (matched to MovieLens):")
-    for _, row in sampled.iterrows():
-        tmdb_title = str(row['title']).strip().lower()
-        matched = movielens_df[movielens_df['clean_title'] == tmdb_title]
+    tmdb_ids = sampled['id'] if 'id' in sampled.columns else [None] * len(sampled)
+    for tmdb_id, title in zip(tmdb_ids, sampled['title']):
+        movie_id = title_index.match(tmdb_id, title)
 
-        if not matched.empty:
-            movie_id = matched.iloc[0]['movieId']
+        if movie_id is not None:
             liked_ids.append(movie_id)
-            print(f"🎬 {row['title']} → ML ID: {movie_id}")
+            print(f"🎬 {title} → ML ID: {movie_id}")
         else:
-            print(f"❌ {row['title']} not found in MovieLens")
+            print(f"❌ {title} not found in MovieLens")
 
     return liked_ids
 
@@ -4,6 +4,7 @@ import requests
 from tqdm import tqdm
 from .filter_embedding import encode_and_save_embeddings_from_csv
 from .filter_embedding import GENRES_PT_FILE, KEYWORDS_PT_FILE, GENRES_CSV_FILE, KEYWORDS_CSV_FILE
+from .filter_embedding import GENRES_COMPACT_PREFIX, KEYWORDS_COMPACT_PREFIX
 
 
 def download_from_url(url, destination):
@@ -53,14 +54,38 @@ def unzip_file(zip_path, extract_to):
 
 def calculate_list_embeddings():
     print("Calculating list embeddings...")
-    # Encode and save the embeddings
-    encode_and_save_embeddings_from_csv(GENRES_CSV_FILE, GENRES_PT_FILE)
-    encode_and_save_embeddings_from_csv(KEYWORDS_CSV_FILE, KEYWORDS_PT_FILE)
+    # Encode and save the embeddings; unchanged CSVs are skipped and grown ones only encode their new rows.
+    # Also written as memory-mappable float16/int8 matrices, which utils prefers over the .pt files
+    compact_dtype = os.getenv("EMBEDDING_DTYPE", "float16")
+    encode_and_save_embeddings_from_csv(GENRES_CSV_FILE, GENRES_PT_FILE, GENRES_COMPACT_PREFIX, compact_dtype)
+    encode_and_save_embeddings_from_csv(KEYWORDS_CSV_FILE, KEYWORDS_PT_FILE, KEYWORDS_COMPACT_PREFIX, compact_dtype)
     print("✅ List embeddings calculated successfully.")
 
+def migrate_legacy_model():
+    # The downloaded svd_model_500 predates model_meta.json: re-save it once in the current
+    # format so serving memory-maps float32 factors instead of reading ratings.csv at every start
+    from .model_based_cf import migrate_model, MODEL_META_FILE
+    model_path = Path(__file__).parent / "svd_model_500"
+    if model_path.exists() and not (model_path / MODEL_META_FILE).exists():
+        print("Migrating the SVD model to the current format...")
+        migrate_model(model_path)
+
+def build_file_caches():
+    # Feather copies of the CSVs and the genre/keyword index, built here once rather than by
+    # every worker that imports utils
+    from .csv_cache import DATASETS, ensure_dataset_cache, load_dataset
+    from .tag_index import TagIndex, TAG_INDEX_FILE, file_fingerprint
+    for name in DATASETS:
+        ensure_dataset_cache(name)
+    tmdb_csv = DATASETS["tmdb"][0]
+    if not os.path.exists(TAG_INDEX_FILE) or TagIndex.load(TAG_INDEX_FILE).fingerprint != file_fingerprint(tmdb_csv):
+        TagIndex.load_or_build(load_dataset("tmdb"), tmdb_csv)
+
 def setup_model_data_auto():
     setup_model_data("https://www.dropbox.com/scl/fi/6g0psqd25dy1ihuzo6pwi/model.zip?rlkey=jfkyihw9c3xchvd8isvlb2pho&st=qvxxs8w0&dl=1")
+    migrate_legacy_model()
     calculate_list_embeddings()
+    build_file_caches()
 
 if __name__ == "__main__":
     setup_model_data_auto()
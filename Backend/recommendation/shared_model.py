@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+import numpy as np
+
+
+SEGMENT_PREFIX = "cinemodel"
+# Published versions kept alive: the current one and the one workers may still be serving
+KEEP_VERSIONS = 2
+
+
+def publish(arrays, version, manifest_path, model_path):
+    """
+    Copy every array into its own shared memory segment and point the manifest at them.
+    Segment names are unique per publish, so the previous version stays attachable until
+    its handles are unlinked. Returns the SharedMemory handles; keep them alive.
+    """
+    tag = f"{SEGMENT_PREFIX}-{os.getpid()}-{time.time_ns()}"
+    segments, handles = {}, []
+    for i, (name, array) in enumerate(arrays.items()):
+        array = np.ascontiguousarray(array)
+        if array.dtype == object:
+            raise ValueError(f"{name} has dtype object and cannot be shared")
+        shm = SharedMemory(name=f"{tag}-{i}", create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        handles.append(shm)
+        segments[name] = {"segment": shm.name, "dtype": array.dtype.str, "shape": list(array.shape)}
+
+    # publish_id changes on every publish, also when SIGHUP republishes the same model version
+    manifest = {"version": version, "publish_id": tag, "model_path": str(model_path),
+                "published_at": time.time(), "arrays": segments}
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)  # workers never see a half-written manifest
+    return handles
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _open_segment(name):
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    shm = SharedMemory(name=name)
+    # Attaching registers the segment with this process's resource tracker, which would
+    # unlink it when the worker exits; only the publisher owns the segments
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class _SegmentArray:
+    """
+    Exposes a segment's memory through __array_interface__ and keeps its SharedMemory handle.
+    Arrays built from it, and every view of those arrays, reference it through .base, so the
+    segment stays mapped as long as any of them is alive.
+    """
+
+    def __init__(self, shm, shape, dtype):
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        array.flags.writeable = False
+        self.__array_interface__ = array.__array_interface__
+        self.shm = shm
+
+
+class SharedModel:
+    """
+    Read-only NumPy views over the segments of one published version. Each view keeps its own
+    segment mapped, so objects built from them (recommender, id maps, embeddings) stay valid
+    after this object is dropped and the publisher unlinked the segments.
+    """
+
+    def __init__(self, manifest):
+        self.version = manifest["version"]
+        self.publish_id = manifest["publish_id"]
+        self.model_path = manifest["model_path"]
+        self.arrays = {}
+        for name, spec in manifest["arrays"].items():
+            shm = _open_segment(spec["segment"])
+            self.arrays[name] = np.asarray(_SegmentArray(shm, tuple(spec["shape"]), np.dtype(spec["dtype"])))
+
+    @classmethod
+    def attach(cls, manifest_path):
+        return cls(read_manifest(manifest_path))
+
+    def group(self, prefix):
+        """
+        The arrays published under "<prefix>.", with the prefix stripped.
+        """
+        prefix = prefix + "."
+        return {name[len(prefix):]: array for name, array in self.arrays.items() if name.startswith(prefix)}
+
+
+def model_arrays(model_path):
+    """
+    Load everything workers need from shared memory: SVD arrays, id maps and filter embeddings.
+    """
+    from .model_based_cf import SVDRecommender
+    from .id_mapping import IdMapping
+    from .csv_cache import load_dataset
+    from .filter_embedding import (load_embeddings, load_compact_embeddings, has_compact_embeddings, compact_arrays,
+                                   GENRES_PT_FILE, KEYWORDS_PT_FILE, GENRES_COMPACT_PREFIX, KEYWORDS_COMPACT_PREFIX)
+
+    recommender = SVDRecommender()
+    recommender.load(model_path)
+    arrays = {f"svd.{name}": array for name, array in recommender.shared_arrays().items()}
+    arrays.update({f"id_mapping.{name}": array for name, array in IdMapping(load_dataset("links")).shared_arrays().items()})
+    for field, pt_file, prefix in (("genres", GENRES_PT_FILE, GENRES_COMPACT_PREFIX),
+                                   ("keywords", KEYWORDS_PT_FILE, KEYWORDS_COMPACT_PREFIX)):
+        entries, embeddings = load_compact_embeddings(prefix) if has_compact_embeddings(prefix) \
+            else load_embeddings(pt_file)
+        arrays.update({f"{field}.{name}": array for name, array in compact_arrays(entries, embeddings).items()})
+    return recommender.version, arrays
+
+
+def serve(manifest_path, model_path):
+    """
+    Publish the model and keep the segments alive. SIGHUP reloads model_path and publishes a
+    new version; SIGTERM / SIGINT unlink every segment and exit.
+    """
+    published = []  # [(version, handles)], oldest first
+    reload_requested = [True]
+    stopping = [False]
+    signal.signal(signal.SIGHUP, lambda *_: reload_requested.__setitem__(0, True))
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.__setitem__(0, True))
+
+    while not stopping[0]:
+        if reload_requested[0]:
+            reload_requested[0] = False
+            start = time.perf_counter()
+            version, arrays = model_arrays(model_path)
+            handles = publish(arrays, version, manifest_path, model_path)
+            published.append((version, handles))
+            size_mb = sum(array.nbytes for array in arrays.values()) / 2 ** 20
+            print(f"✅ Published {version}: {len(arrays)} arrays, {size_mb:.1f} MB "
+                  f"in {time.perf_counter() - start:.1f}s")
+            del arrays
+            while len(published) > KEEP_VERSIONS:
+                old_version, old_handles = published.pop(0)
+                for shm in old_handles:
+                    shm.close()
+                    shm.unlink()
+                print(f"Retired {old_version}")
+        time.sleep(0.5)
+
+    for _, handles in published:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+if __name__ == "__main__":
+    # python -m recommendation.shared_model --manifest /dev/shm/cinemodel.json
+    parser = argparse.ArgumentParser(description="Publish the recommendation model in shared memory.")
+    parser.add_argument("--manifest", default=os.getenv("SHARED_MODEL_MANIFEST", "/dev/shm/cinemodel.json"))
+    parser.add_argument("--model", default=str(Path(__file__).parent / "svd_model_500"))
+    args = parser.parse_args()
+    serve(args.manifest, args.model)
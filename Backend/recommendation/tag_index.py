@@ -0,0 +1,103 @@
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .fileio import atomic_path
+
+
+TAG_INDEX_FILE = Path(__file__).parent / "filter_options" / "tag_index.npz"
+TAG_FIELDS = ("genres", "keywords")
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+
+class TagIndex:
+    """
+    Inverted index from normalized genre / keyword tokens to row positions of the TMDB dataset.
+    Every field has a sorted token vocabulary and CSR-style offsets into sorted int32 posting
+    lists, so selecting candidate movies is a union of posting lists per field and an
+    intersection across fields.
+    """
+
+    def __init__(self, n_rows, fields, fingerprint=None):
+        self.n_rows = n_rows
+        self.fields = fields  # field -> (vocabulary, offsets, postings)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, tmdb_df, fingerprint=None):
+        fields = {}
+        for field in TAG_FIELDS:
+            # Same tokens as the comma-separated lists in filter_options/, index labels are row positions
+            column = tmdb_df[field].reset_index(drop=True)
+            tokens = column.fillna("").astype(str).str.lower().str.split(",").explode().str.strip()
+            tokens = tokens[tokens != ""]
+            codes, vocabulary = pd.factorize(tokens, sort=True)
+            rows = tokens.index.to_numpy().astype(np.int64)
+            pairs = np.unique(np.stack([codes.astype(np.int64), rows]), axis=1)  # sorted by token, then row
+            offsets = np.searchsorted(pairs[0], np.arange(len(vocabulary) + 1))
+            fields[field] = (np.asarray(vocabulary, dtype=str), offsets, pairs[1].astype(np.int32))
+        return cls(len(tmdb_df), fields, fingerprint)
+
+    @classmethod
+    def load_or_build(cls, tmdb_df, csv_path, index_path=TAG_INDEX_FILE):
+        """
+        Load the persisted index if it was built from the same CSV, otherwise build and store it.
+        """
+        fingerprint = file_fingerprint(csv_path)
+        if os.path.exists(index_path):
+            index = cls.load(index_path)
+            if index.fingerprint == fingerprint and index.n_rows == len(tmdb_df):
+                return index
+            print("TMDB dataset changed, rebuilding the genre/keyword index...")
+
+        start = time.perf_counter()
+        index = cls.build(tmdb_df, fingerprint)
+        index.save(index_path)
+        print(f"✅ Built genre/keyword index in {time.perf_counter() - start:.1f}s")
+        return index
+
+    def save(self, path):
+        arrays = {"n_rows": self.n_rows, "fingerprint": self.fingerprint or ""}
+        for field, (vocabulary, offsets, postings) in self.fields.items():
+            arrays[f"{field}_vocabulary"] = vocabulary
+            arrays[f"{field}_offsets"] = offsets
+            arrays[f"{field}_postings"] = postings
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        fields = {field: (data[f"{field}_vocabulary"], data[f"{field}_offsets"], data[f"{field}_postings"])
+                  for field in TAG_FIELDS}
+        return cls(int(data["n_rows"]), fields, str(data["fingerprint"]) or None)
+
+    def rows_matching(self, field, terms):
+        """
+        Sorted rows whose field has a token containing any of the terms (case-insensitive),
+        the same substring match build_liked_list_from_preferences used on the raw text.
+        """
+        vocabulary, offsets, postings = self.fields[field]
+        matched = np.zeros(len(vocabulary), dtype=bool)
+        for term in terms:
+            matched |= np.char.find(vocabulary, term.strip().lower()) >= 0
+        lists = [postings[offsets[i]:offsets[i + 1]] for i in np.flatnonzero(matched)]
+        return np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int32)
+
+    def filter_rows(self, genres=None, keywords=None):
+        """
+        Rows matching any genre and any keyword; a field without terms does not filter.
+        Returns None when nothing filters, meaning every row.
+        """
+        rows = None
+        for field, terms in (("genres", genres), ("keywords", keywords)):
+            if not terms:
+                continue
+            field_rows = self.rows_matching(field, terms)
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+        return rows
@@ -0,0 +1,87 @@
+import gc
+import tempfile
+import threading
+from multiprocessing import resource_tracker
+import numpy as np
+import pandas as pd
+from model_based_cf import SVDRecommender
+from id_mapping import IdMapping
+from shared_model import publish, SharedModel
+
+
+def synthetic_model(path, seed):
+    rng = np.random.default_rng(seed)
+    n = 5000
+    ratings = pd.DataFrame({
+        "userId": rng.integers(1, 201, n),
+        "movieId": rng.integers(1, 301, n),
+        "rating": rng.integers(1, 11, n) / 2.0,
+    })
+    movies = pd.DataFrame({"movieId": np.arange(1, 301), "title": [f"Movie {i}" for i in range(1, 301)]})
+    recommender = SVDRecommender(n_components=10)
+    recommender.train(ratings, movies)
+    recommender.save(path)
+    return recommender
+
+
+def publish_model(recommender, manifest_path, path):
+    links = pd.DataFrame({"movieId": recommender.movie_ids, "tmdbId": recommender.movie_ids * 7, "imdbId": 1})
+    arrays = {f"svd.{name}": array for name, array in recommender.shared_arrays().items()}
+    arrays.update({f"id_mapping.{name}": array for name, array in IdMapping(links).shared_arrays().items()})
+    return publish(arrays, recommender.version, manifest_path, path)
+
+
+def retire(handles):
+    for shm in handles:
+        shm.close()
+        # Attaching in this process already unregistered the name from the resource tracker
+        resource_tracker.register(shm._name, "shared_memory")
+        shm.unlink()
+
+
+def test_swap_while_old_model_in_use():
+    """
+    Requests holding the recommender and id map of a retired publish keep working after the
+    SharedModel is replaced and its segments unlinked (they used to crash the process).
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest_path = f"{tmp}/manifest.json"
+        old_handles = publish_model(synthetic_model(f"{tmp}/a", 1), manifest_path, f"{tmp}/a")
+        shared = SharedModel.attach(manifest_path)
+        recommender = SVDRecommender.from_shared(shared.group("svd"), shared.version, shared.model_path)
+        id_mapping = IdMapping.from_arrays(shared.group("id_mapping"))
+        liked = recommender.movie_ids[:3].tolist()
+        expected = recommender.recommend_new_user(liked, k=10, min_ratings=1)
+
+        errors = []
+        stop = threading.Event()
+
+        def serve():
+            # a request that took the old model before the swap
+            while not stop.is_set():
+                try:
+                    pd.testing.assert_frame_equal(recommender.recommend_new_user(liked, k=10, min_ratings=1), expected)
+                    assert id_mapping.tmdb_to_movie([liked[0] * 7])[0].tolist() == [liked[0]]
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        new_handles = publish_model(synthetic_model(f"{tmp}/b", 2), manifest_path, f"{tmp}/b")
+        shared = SharedModel.attach(manifest_path)  # what sync_shared_model does
+        retire(old_handles)
+        gc.collect()
+        stop.set()
+        thread.join()
+
+        assert not errors, errors
+        pd.testing.assert_frame_equal(recommender.recommend_new_user(liked, k=10, min_ratings=1), expected)
+        assert shared.group("svd")["item_factors"].shape[1] == 10
+        del shared
+        retire(new_handles)
+
+
+if __name__ == "__main__":
+    test_swap_while_old_model_in_use()
+    print("✅ Old shared model views survive a swap")
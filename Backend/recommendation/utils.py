@@ -1,86 +1,297 @@
+import atexit
+import os
+import threading
 from pathlib import Path
-import pandas as pd
-from .filter_embedding import load_embeddings, get_names_with_score_gt, find_top_k_similar_from_cache, GENRES_PT_FILE, KEYWORDS_PT_FILE
-from .predict_newuser import build_liked_list_from_preferences
+from .cache import TTLCache
+from .filter_embedding import load_embeddings, load_compact_embeddings, has_compact_embeddings, resolve_terms, QueryCache
+from .filter_embedding import get_model, compact_from_arrays
+from .filter_embedding import GENRES_PT_FILE, KEYWORDS_PT_FILE, GENRES_COMPACT_PREFIX, KEYWORDS_COMPACT_PREFIX
+from .predict_newuser import build_liked_list_from_preferences, TitleIndex
 from .model_based_cf import SVDRecommender
+from .id_mapping import IdMapping
+from .metadata_store import MovieMetadataStore
+from .tag_index import TagIndex
+from .loader import recommendation_loader
+from .csv_cache import load_dataset, DATASETS, DATASET_STATS
+from .shared_model import SharedModel, read_manifest
+from .model_registry import ModelRegistry
 
 print("Loading recommendation essentials...")
-links_df = pd.read_csv(Path(__file__).parent / "TheMoviesDataset/links.csv", dtype={"tmdbId": str})  # Ensure imdbId is treated as string
-tmdb_df = pd.read_csv(Path(__file__).parent / "TMDB_movie_dataset_v11.csv")  # Your cleaned TMDB dataset
-movielens_df = pd.read_csv(Path(__file__).parent / "TheMoviesDataset/movies.csv")  # with movieId, title, genres
-movie_meta_df = pd.read_csv(Path(__file__).parent / "TheMoviesDataset/movies_metadata.csv", dtype={"id": str})
-recommender = SVDRecommender()
-recommender.load(Path(__file__).parent / "svd_model_500/")
-genres_list, genres_embeddings = load_embeddings(GENRES_PT_FILE)
-keywords_list, keywords_embeddings = load_embeddings(KEYWORDS_PT_FILE)
+MODEL_DIR = Path(__file__).parent / "svd_model_500"
+# Written by a successful /admin/model/reload; every process loads the directory it names
+ACTIVE_MODEL_FILE = os.getenv("ACTIVE_MODEL_FILE", str(Path(__file__).parent / "active_model.json"))
+# /admin/model/reload only loads model directories below this one; loading unpickles files
+MODELS_ROOT = os.path.realpath(os.getenv("MODELS_ROOT", str(Path(__file__).parent)))
+# With a shared_model.py publisher running, the SVD arrays, id maps and filter embeddings are
+# attached read-only from its shared memory instead of being loaded by every worker
+SHARED_MODEL_MANIFEST = os.getenv("SHARED_MODEL_MANIFEST")
+shared_model = None
+_shared_manifest_mtime = None
+_shared_manifest_problem = None  # last reason the manifest could not be followed, logged once
+_shared_lock = threading.Lock()
+if SHARED_MODEL_MANIFEST:
+    with recommendation_loader.stage("shared_model") as artifact:
+        _shared_manifest_mtime = os.stat(SHARED_MODEL_MANIFEST).st_mtime_ns
+        shared_model = SharedModel.attach(SHARED_MODEL_MANIFEST)
+        artifact["version"] = shared_model.version
+# Projected columns from the Feather cache of each CSV, see csv_cache.py
+with recommendation_loader.stage("id_mapping") as artifact:
+    if shared_model is not None:
+        id_mapping = IdMapping.from_arrays(shared_model.group("id_mapping"))
+    else:
+        id_mapping = IdMapping(load_dataset("links"))
+        artifact.update(DATASET_STATS["links"])
+with recommendation_loader.stage("tmdb_dataset") as artifact:
+    tmdb_df = load_dataset("tmdb")  # Your cleaned TMDB dataset
+    artifact.update(DATASET_STATS["tmdb"])
+with recommendation_loader.stage("tag_index"):
+    tag_index = TagIndex.load_or_build(tmdb_df, DATASETS["tmdb"][0])
+with recommendation_loader.stage("movielens_movies") as artifact:
+    movielens_df = load_dataset("movielens_movies")  # with movieId, title
+    artifact.update(DATASET_STATS["movielens_movies"])
+with recommendation_loader.stage("movie_metadata") as artifact:
+    movie_meta = MovieMetadataStore(load_dataset("movies_metadata"))
+    artifact.update(DATASET_STATS["movies_metadata"])
+with recommendation_loader.stage("title_index"):
+    title_index = TitleIndex(movielens_df, id_mapping)
+# recommend_* take model_registry.current once per request, reloads swap it underneath
+model_registry = ModelRegistry(pointer_file=None if SHARED_MODEL_MANIFEST else ACTIVE_MODEL_FILE)
+with recommendation_loader.stage("svd_model") as artifact:
+    if shared_model is not None:
+        model_registry.swap(SVDRecommender.from_shared(shared_model.group("svd"), shared_model.version,
+                                                       shared_model.model_path), shared_model.model_path)
+    else:
+        model_registry.load(model_registry.active_path(MODEL_DIR))
+    artifact["version"] = model_registry.current.version
+# Ranked top-100 pools per liked set, "refresh" re-samples from the cached pool
+recommendation_cache = TTLCache(
+    max_size=int(os.getenv("RECOMMENDATION_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", 600)),
+)
+model_registry.on_swap.append(lambda recommender: recommendation_cache.clear())
+with recommendation_loader.stage("filter_embeddings"):
+    # Memory-mapped float16/int8 embeddings are shared between workers through the page cache
+    if shared_model is not None:
+        genres_list, genres_embeddings = compact_from_arrays(shared_model.group("genres"))
+        keywords_list, keywords_embeddings = compact_from_arrays(shared_model.group("keywords"))
+    elif has_compact_embeddings(GENRES_COMPACT_PREFIX) and has_compact_embeddings(KEYWORDS_COMPACT_PREFIX):
+        genres_list, genres_embeddings = load_compact_embeddings(GENRES_COMPACT_PREFIX)
+        keywords_list, keywords_embeddings = load_compact_embeddings(KEYWORDS_COMPACT_PREFIX)
+    else:
+        genres_list, genres_embeddings = load_embeddings(GENRES_PT_FILE)
+        keywords_list, keywords_embeddings = load_embeddings(KEYWORDS_PT_FILE)
+# Genre names are the most frequent chat terms and are already encoded in genres.pt
+query_cache = QueryCache(max_size=int(os.getenv("QUERY_CACHE_SIZE", 4096)))
+query_cache.warm(genres_list, genres_embeddings)
+if os.getenv("QUERY_CACHE_FILE"):
+    query_cache.load(os.getenv("QUERY_CACHE_FILE"))
+    atexit.register(query_cache.save, os.getenv("QUERY_CACHE_FILE"))
+with recommendation_loader.stage("sentence_transformer"):
+    get_model()  # load it now rather than on the first chat request
 print("Recommendation essentials loaded successfully.")
 
 def movieId_to_tmdbId(movie_id):
-    result = links_df[links_df['movieId'] == movie_id]['tmdbId']
-    return result.iloc[0] if not result.empty else None
+    tmdb_ids, found = id_mapping.movie_to_tmdb([movie_id])
+    return int(tmdb_ids[0]) if found[0] else None
 
-def tmdbId_to_movieId(imdb_id):
-    result = links_df[links_df['tmdbId'] == imdb_id]['movieId']
-    return result.iloc[0] if not result.empty else None
+def tmdbId_to_movieId(tmdb_id):
+    movie_ids, found = id_mapping.tmdb_to_movie([tmdb_id])
+    return int(movie_ids[0]) if found[0] else None
 
 def batch_tmdbId_to_movieId(tmdb_ids):
-    result = links_df[links_df['tmdbId'].isin(tmdb_ids)]['movieId']
-    # return list
-    return result.tolist() if not result.empty else []
+    movie_ids, found = id_mapping.tmdb_to_movie(tmdb_ids)
+    if not found.all():
+        print(f"⚠️ {int((~found).sum())} of {len(found)} TMDB ids have no MovieLens id")
+    # return list, in input order
+    return movie_ids[found].tolist()
 
 def batch_movieId_to_tmdbId(movie_ids):
-    result = links_df[links_df['movieId'].isin(movie_ids)]['tmdbId']
-    # return list
-    return result.tolist() if not result.empty else []
+    tmdb_ids, found = id_mapping.movie_to_tmdb(movie_ids)
+    if not found.all():
+        print(f"⚠️ {int((~found).sum())} of {len(found)} MovieLens ids have no TMDB id")
+    # return list, in input order
+    return tmdb_ids[found].tolist()
+
+def get_metas(movie_ids):
+    """
+    Metadata (TMDB id, title, release date) for MovieLens ids, in input order, None where unknown.
+    movies_metadata.csv is keyed by TMDB id, so the ids are translated first.
+    """
+    tmdb_ids, found = id_mapping.movie_to_tmdb(movie_ids)
+    metas = movie_meta.get_many(tmdb_ids)
+    return [meta if hit else None for meta, hit in zip(metas, found)]
 
 def get_mata(movie_id):
-    # filter by movieId
-    df = movie_meta_df[movie_meta_df['id'] == str(int(movie_id))]
-    if df.empty:
-        return None
-    # convert first row to dict
-    # print(df.iloc[0].to_dict())
-    df = df[['id', 'title', 'release_date']]
-    return df.iloc[0].to_dict()
+    return get_metas([movie_id])[0]
 
 def recommend_by_tmdb_movies(tmdb_ids):
-    movie_ids = batch_movieId_to_tmdbId(tmdb_ids)
+    sync_model()
+    movie_ids = batch_tmdbId_to_movieId(tmdb_ids)
     return recommend_by_movies_ids(movie_ids)
 
+def sync_shared_model():
+    """
+    Switch to what the shared memory publisher announced last, if it is a new publish (a
+    republish of the same model version after SIGHUP counts as new).
+    The previous views stay valid for requests still using them.
+    """
+    global shared_model, id_mapping
+    global genres_list, genres_embeddings, keywords_list, keywords_embeddings
+    global _shared_manifest_mtime, _shared_manifest_problem
+    if shared_model is None:
+        return
+    with _shared_lock:
+        try:
+            mtime = os.stat(SHARED_MODEL_MANIFEST).st_mtime_ns
+        except FileNotFoundError:
+            # The publisher removes the manifest when it stops; the attached segments stay usable
+            _keep_shared_model(f"{SHARED_MODEL_MANIFEST} is missing")
+            return
+        if mtime == _shared_manifest_mtime:
+            return
+        try:
+            manifest = read_manifest(SHARED_MODEL_MANIFEST)
+            new_shared = SharedModel(manifest) if manifest["publish_id"] != shared_model.publish_id else None
+        except (OSError, ValueError, KeyError) as e:
+            # Unreadable, or naming segments that are gone; wait for the next publish
+            _keep_shared_model(f"Cannot attach {SHARED_MODEL_MANIFEST} ({type(e).__name__}: {e})")
+            _shared_manifest_mtime = mtime
+            return
+        if new_shared is not None:
+            recommender = SVDRecommender.from_shared(new_shared.group("svd"), new_shared.version, new_shared.model_path)
+            model_registry.swap(recommender, new_shared.model_path)
+            id_mapping = IdMapping.from_arrays(new_shared.group("id_mapping"))
+            title_index.id_mapping = id_mapping
+            genres_list, genres_embeddings = compact_from_arrays(new_shared.group("genres"))
+            keywords_list, keywords_embeddings = compact_from_arrays(new_shared.group("keywords"))
+            shared_model = new_shared
+            query_cache.matches.clear()
+            print(f"Attached shared model {shared_model.version}")
+        _shared_manifest_mtime = mtime
+        _shared_manifest_problem = None
+
+def _keep_shared_model(reason):
+    global _shared_manifest_problem
+    if reason != _shared_manifest_problem:
+        print(f"⚠️ {reason}; still serving shared model {shared_model.version}")
+        _shared_manifest_problem = reason
+
+def sync_model():
+    """
+    Pick up a model another process switched to: a new shared memory version, or the
+    directory a reload in another worker recorded in ACTIVE_MODEL_FILE.
+    """
+    if shared_model is not None:
+        sync_shared_model()
+    else:
+        model_registry.sync()
+
+def resolve_model_path(path):
+    """
+    path (relative to MODELS_ROOT, or absolute) as a real path; raises ValueError if it
+    points outside MODELS_ROOT, also through symlinks or "..".
+    """
+    resolved = os.path.realpath(os.path.join(MODELS_ROOT, path))
+    if os.path.commonpath([resolved, MODELS_ROOT]) != MODELS_ROOT or resolved == MODELS_ROOT:
+        raise ValueError(f"Model directory {path} is not inside {MODELS_ROOT}")
+    return resolved
+
+def reload_model(path=None):
+    """
+    Start loading path (default: the active directory again) in the background. The model is
+    smoke-tested before it replaces the active one; model_status() reports the progress.
+    """
+    if shared_model is not None:
+        raise ValueError("The model is published by shared_model.py, send the publisher SIGHUP to reload it")
+    started = model_registry.reload(resolve_model_path(path) if path else model_registry.path)
+    status = model_status()
+    status["started"] = started
+    return status
+
+def model_status():
+    sync_model()
+    status = model_registry.status()
+    status["shared_model"] = {"version": shared_model.version, "publish_id": shared_model.publish_id} \
+        if shared_model is not None else None
+    return status
+
+def recommendation_cache_stats():
+    stats = recommendation_cache.stats()
+    stats["model_version"] = model_registry.current.version
+    stats["query_cache"] = query_cache.stats()
+    return stats
+
 def recommend_by_movies_ids(movie_ids):
-    results = recommender.recommend_new_user(
-        liked_movie_ids=movie_ids,
-        k=60,
-        refresh=True  # enable refreshable results
-    )  # df[['movieId', 'title', 'predicted_rating', 'rating_count']]
+    model = model_registry.current  # keep one model for the whole request, even if it is reloaded meanwhile
+    if not movie_ids:
+        # cold start samples from every popular movie, which is already cheap
+        results = model.recommend_new_user(liked_movie_ids=movie_ids, k=60, refresh=True)
+    else:
+        key = (frozenset(movie_ids), model.version)
+        pool = recommendation_cache.get(key)
+        if pool is None:
+            pool = model.recommend_new_user(liked_movie_ids=movie_ids, k=100, refresh=False)
+            recommendation_cache.put(key, pool)
+        # refreshable results: a new sample of the ranked pool on every call
+        results = pool.sample(n=min(60, len(pool)))
+    # df[['movieId', 'title', 'predicted_rating', 'rating_count']]
     # print("Recommended movies:\n", results)
     # for each movie, get meta, and join them to a json object
-    results = results[['movieId', 'predicted_rating']]
     final_results = []
-    for index, row in results.iterrows():
-        movie_id = row['movieId']
-        meta = get_mata(movie_id)
-        # print("Movie ID:", str(int(movie_id)))
-        # print("Meta:", meta)
+    metas = get_metas(results['movieId'].tolist())
+    for meta, predicted_rating in zip(metas, results['predicted_rating']):
         if meta is None:
             continue
-        meta['predicted_rating'] = float(row['predicted_rating'])
+        meta['predicted_rating'] = float(predicted_rating)
         final_results.append(meta)
     return final_results[:20]
 
+def similar_movies(title, k=20):
+    """
+    Movies most similar to the one titled title, from the precomputed item neighbours of the
+    active model (python -m recommendation.item_neighbors). None if the title is unknown.
+    """
+    sync_model()
+    movie_id = title_index.lookup(title)
+    if movie_id is None:
+        return None
+    results = model_registry.current.similar_items(int(movie_id), k=k)
+    if results is None:
+        return None
+    similar = []
+    for meta, similarity in zip(get_metas(results['movieId'].tolist()), results['similarity']):
+        if meta is None:
+            continue
+        meta['similarity'] = float(similarity)
+        similar.append(meta)
+    return {"movie": get_mata(int(movie_id)), "results": similar}
+
+def recommend_batch(liked_movie_ids_lists=None, user_ids=None, k=20):
+    """
+    Batch recommendations for many MovieLens profiles, yielded one JSON-ready dict per profile.
+    """
+    sync_model()
+    rows = model_registry.current.recommend_batch(liked_movie_ids_lists=liked_movie_ids_lists, user_ids=user_ids, k=k)
+    for kind, position, results in rows:
+        row = {"kind": kind, "index": position}
+        if results is None:
+            row["error"] = "User not found in training data."
+        else:
+            row["results"] = [{
+                "movieId": int(movie_id),
+                "title": title if isinstance(title, str) else None,
+                "predicted_rating": float(score),
+            } for movie_id, title, score in zip(results['movieId'], results['title'], results['predicted_rating'])]
+        yield row
+
 def recommend_by_genres(genres, keywords):
+    sync_model()
     print(f"Genres: {genres}, Keywords: {keywords}")
-    fuzzy_genres = []
-    for genre in genres:
-        fuzzy_genres_lst = find_top_k_similar_from_cache(genre, genres_list, genres_embeddings, k=3)
-        fuzzy_genres.extend(get_names_with_score_gt(fuzzy_genres_lst, 0.5))
-    fuzzy_genres = list(set(fuzzy_genres))
-
-    fuzzy_keywords = []
-    for keyword in keywords:
-        fuzzy_keywords_lst = find_top_k_similar_from_cache(keyword, keywords_list, keywords_embeddings, k=3)
-        fuzzy_keywords.extend(get_names_with_score_gt(fuzzy_keywords_lst, 0.5))
-    fuzzy_keywords = list(set(fuzzy_keywords))
+    # One encoder pass for every term, one similarity matrix per option list
+    fuzzy_genres, fuzzy_keywords = resolve_terms([
+        (genres, genres_list, genres_embeddings),
+        (keywords, keywords_list, keywords_embeddings),
+    ], k=3, min_score=0.5, cache=query_cache)
 
     print(f"Fuzzy genres: {fuzzy_genres}, fuzzy keywords: {fuzzy_keywords}")
 
@@ -89,7 +300,9 @@ def recommend_by_genres(genres, keywords):
         movielens_df,
         genres=fuzzy_genres,
         keywords=fuzzy_keywords,
-        sample_size=20
+        sample_size=20,
+        tag_index=tag_index,
+        title_index=title_index
     )
 
     return recommend_by_movies_ids(liked_movies)
\ No newline at end of file